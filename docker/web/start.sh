@@ -4,5 +4,6 @@ set -o errexit
 set -o nounset
 
 poetry run python manage.py migrate --noinput
+poetry run python manage.py createcachetable
 poetry run python manage.py collectstatic --noinput
 poetry run python manage.py runserver 0.0.0.0:8000
\ No newline at end of file
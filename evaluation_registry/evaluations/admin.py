@@ -1,24 +1,21 @@
-import csv
-import datetime
-
 from django.contrib import admin
-from django.contrib.postgres.search import (
-    SearchQuery,
-    SearchRank,
-    SearchVector,
-)
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import Exists, F, OuterRef
 from simple_history.admin import SimpleHistoryAdmin
 
 from . import models
-from .management.commands import load_rsm_csv
-from .management.commands.reformat_description import reformat_evaluation
+from .management.commands.reformat_description import (
+    TextReformatter,
+    reformat_evaluations,
+)
 from .models import (
-    Evaluation,
     EvaluationDepartmentAssociation,
     EvaluationDesignTypeDetail,
     EventDate,
     Report,
 )
+from .pagination import EstimatedCountPaginator
+from .reference_data import get_design_types
 
 admin_site = admin.AdminSite()
 
@@ -28,13 +25,11 @@ def import_csv(modeladmin, request, queryset):
         modeladmin.message_user(request, "Please select exactly one file to import.", level="ERROR")
         return
 
-    file = queryset.first()
-    text_file = (line.decode() for line in file.csv.file)
-    records = list(csv.DictReader(text_file))
-    cmd = load_rsm_csv.Command()
-    cmd.process_tabular_data(records)
-    file.last_successfully_loaded_at = datetime.datetime.now()
-    file.save()
+    # imports can take longer than a request, the run_rsm_imports worker picks this up
+    if not queryset.queue():
+        modeladmin.message_user(request, "The selected file is already being imported.", level="WARNING")
+        return
+    modeladmin.message_user(request, "The selected file has been queued for import.")
 
 
 import_csv.short_description = "Import selected CSV file"  # type: ignore
@@ -42,8 +37,21 @@ import_csv.short_description = "Import selected CSV file"  # type: ignore
 
 class RSMFileAdmin(admin.ModelAdmin):
     actions = [import_csv]
-    list_display = ["id", "csv", "last_successfully_loaded_at"]
-    readonly_fields = ["last_successfully_loaded_at"]
+    list_display = ["id", "csv", "status", "rows_processed", "queued_at", "finished_at", "last_successfully_loaded_at"]
+    list_filter = ["status"]
+    readonly_fields = [
+        "last_successfully_loaded_at",
+        "status",
+        "queued_at",
+        "started_at",
+        "heartbeat_at",
+        "finished_at",
+        "attempts",
+        "rows_processed",
+        "checkpoint_offset",
+        "import_counts",
+        "error",
+    ]
 
 
 class EventDateInline(admin.TabularInline):
@@ -67,32 +75,55 @@ class EvaluationDesignTypeDetailInline(admin.TabularInline):
 
 
 def reformat_text(modeladmin, request, queryset):
-    for evaluation in queryset:
-        reformat_evaluation(evaluation)
+    reformat_evaluations(queryset, TextReformatter(), user=request.user)
 
 
 reformat_text.short_description = "Reformat selected evaluations"  # type: ignore
 
 
+class EvaluationDesignTypeListFilter(admin.SimpleListFilter):
+    """an EXISTS semi-join rather than the m2m join, so the changelist needs no distinct"""
+
+    title = "evaluation design types"
+    parameter_name = "design_type"
+
+    def lookups(self, request, model_admin):
+        return [(design_type.code, design_type.display) for design_type in get_design_types()]
+
+    def queryset(self, request, queryset):
+        if not self.value():
+            return queryset
+        return queryset.filter(
+            Exists(EvaluationDesignTypeDetail.objects.filter(evaluation=OuterRef("pk"), design_type__code=self.value()))
+        )
+
+
 class EvaluationAdmin(SimpleHistoryAdmin):
-    list_display = ["title", "rsm_evaluation_id", "lead_department", "visibility"]
-    list_filter = ["visibility", "evaluation_design_types__display"]
+    list_display = ["title", "rsm_evaluation_id", "lead_department_display", "visibility"]
+    list_filter = ["visibility", EvaluationDesignTypeListFilter]
+    list_select_related = ["lead_department"]
     search_fields = ("title", "brief_description")
     inlines = [ReportInline, EventDateInline, EvaluationDepartmentAssociationInline, EvaluationDesignTypeDetailInline]
     actions = [reformat_text]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # the manager already select_relates created_by, which stops the changelist applying list_select_related
+        return super().get_queryset(request).select_related(*self.list_select_related)
+
+    @admin.display(description="lead department", ordering="lead_department__display")
+    def lead_department_display(self, evaluation):
+        return evaluation.lead_department
 
     def get_search_results(self, request, queryset, search_term):
         if not search_term:
             return super().get_search_results(request, queryset, search_term)
 
-        search_title = SearchVector("title", weight="A")
-        description_search = SearchVector("brief_description", weight="B")
-        search_vector = search_title + description_search
-
         search_query = SearchQuery(search_term)
         queryset = (
-            Evaluation.objects.annotate(search=search_vector, rank=SearchRank(search_vector, search_query))
-            .filter(search=search_query)
+            queryset.filter(search_vector=search_query)
+            .annotate(rank=SearchRank(F("search_vector"), search_query))
             .order_by("-rank")
         )
         return queryset, False
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class EvaluationsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "evaluation_registry.evaluations"
+
+    def ready(self):
+        # connects the reference-data cache invalidation signals
+        from evaluation_registry.evaluations import (  # noqa: F401
+            reference_data,
+        )
@@ -1,20 +1,30 @@
+from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.forms import (
+    BaseModelFormSet,
     BooleanField,
     CharField,
+    Field,
     Form,
     ModelChoiceField,
     ModelForm,
     ModelMultipleChoiceField,
     MultipleChoiceField,
+    SelectMultiple,
     URLField,
+    modelformset_factory,
 )
+from django.utils import timezone
 
 from evaluation_registry.evaluations import models
 from evaluation_registry.evaluations.models import (
-    Department,
     Evaluation,
-    EvaluationDesignType,
     EventDate,
+    Taxonomy,
+)
+from evaluation_registry.evaluations.reference_data import (
+    get_departments,
+    get_design_types,
 )
 
 
@@ -26,6 +36,84 @@ class NullableModelMultipleChoiceField(ModelMultipleChoiceField):
         return super().clean(value)
 
 
+class PreloadedChoiceField(Field):
+    """like a ModelChoiceField, but validated against objects that are already in memory,
+    such as the cached reference data, so that cleaning it never queries the database
+    """
+
+    default_error_messages = {
+        "invalid_choice": "Select a valid choice. That choice is not one of the available choices.",
+    }
+
+    def __init__(self, get_objects, *, to_field_name="code", **kwargs):
+        super().__init__(**kwargs)
+        self.get_objects = get_objects
+        self.to_field_name = to_field_name
+
+    def get_lookup(self):
+        return {str(getattr(obj, self.to_field_name)): obj for obj in self.get_objects()}
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            return self.get_lookup()[str(value)]
+        except KeyError:
+            raise ValidationError(self.error_messages["invalid_choice"], code="invalid_choice")
+
+    def has_changed(self, initial, data):
+        if self.disabled:
+            return False
+
+        def key(value):
+            return "" if value in self.empty_values else str(getattr(value, self.to_field_name, value))
+
+        return key(initial) != key(data)
+
+
+class PreloadedMultipleChoiceField(PreloadedChoiceField):
+    """the multiple-choice version, returns a list of objects and ignores empty values"""
+
+    widget = SelectMultiple
+    default_error_messages = {
+        "invalid_choice": "Select a valid choice. %(value)s is not one of the available choices.",
+    }
+
+    def to_python(self, value):
+        values = [str(v) for v in value or [] if v not in self.empty_values]
+        lookup = self.get_lookup()
+        for v in values:
+            if v not in lookup:
+                raise ValidationError(self.error_messages["invalid_choice"], code="invalid_choice", params={"value": v})
+        return [lookup[v] for v in dict.fromkeys(values)]
+
+    def has_changed(self, initial, data):
+        if self.disabled:
+            return False
+
+        def key(value):
+            return str(getattr(value, self.to_field_name, value))
+
+        return {key(v) for v in initial or []} != {key(v) for v in data or [] if v not in self.empty_values}
+
+
+class PreloadedEvaluationMixin:
+    """for forms about an evaluation the view has already loaded, the submitted evaluation id
+    is checked against that one instead of being looked up
+    """
+
+    def __init__(self, *args, evaluation=None, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        if evaluation:
+            self.fields["evaluation"] = PreloadedChoiceField(
+                lambda: [evaluation],
+                to_field_name="id",
+                label="Evaluation",
+                error_messages={"required": "Evaluation is required"},
+            )
+
+
 class NamedErrorsModelForm(ModelForm):
     def __init__(self, *args, **kwargs):
         super(NamedErrorsModelForm, self).__init__(*args, **kwargs)
@@ -35,10 +123,8 @@ class NamedErrorsModelForm(ModelForm):
 
 
 class EvaluationBasicDetailsForm(NamedErrorsModelForm):
-    lead_department = ModelChoiceField(queryset=Department.objects.all(), to_field_name="code", label="Lead Department")
-    departments = NullableModelMultipleChoiceField(
-        queryset=Department.objects.all(), to_field_name="code", required=False
-    )
+    lead_department = PreloadedChoiceField(get_departments, label="Lead Department")
+    departments = PreloadedMultipleChoiceField(get_departments, required=False)
 
     def clean(self):
         super().clean()
@@ -46,7 +132,7 @@ class EvaluationBasicDetailsForm(NamedErrorsModelForm):
         departments = self.cleaned_data.get("departments")
 
         if departments:
-            if departments.filter(id=lead_department.id).exists():
+            if lead_department in departments:
                 self.add_error(
                     "departments", f"This department has been listed more than once: {lead_department.display}"
                 )
@@ -56,18 +142,16 @@ class EvaluationBasicDetailsForm(NamedErrorsModelForm):
         fields = ["status", "title"]
 
 
-class EvaluationDesignTypeDetailForm(Form):
+class EvaluationDesignTypeDetailForm(PreloadedEvaluationMixin, Form):
     evaluation = ModelChoiceField(queryset=Evaluation.objects.all(), label="Evaluation")
-    design_types = ModelMultipleChoiceField(
-        queryset=EvaluationDesignType.objects.all(), label="Evaluation type", to_field_name="code", required=False
-    )
+    design_types = PreloadedMultipleChoiceField(get_design_types, label="Evaluation type", required=False)
     text = CharField(max_length=1024, required=False)
 
     def __init__(self, *args, **kwargs):
         super(EvaluationDesignTypeDetailForm, self).__init__(*args, **kwargs)
 
         for field in self.fields.values():
-            field.error_messages = {"required": f"{field.label} is required"}
+            field.error_messages["required"] = f"{field.label} is required"
 
     def clean(self):
         super().clean()
@@ -75,10 +159,36 @@ class EvaluationDesignTypeDetailForm(Form):
         text = self.cleaned_data.get("text")
 
         if design_types:
-            if design_types.filter(collect_description=True).exists() and not text:
+            if any(design_type.collect_description for design_type in design_types) and not text:
                 self.add_error("text", "Please provide additional description for the 'Other' choice")
 
 
+class EvaluationDescriptionForm(ModelForm):
+    class Meta:
+        model = Evaluation
+        fields = [
+            "brief_description",
+            "grant_number",
+            "has_grant_number",
+            "major_project_number",
+            "has_major_project_number",
+        ]
+
+
+class EvaluationPoliciesForm(ModelForm):
+    policies = ModelMultipleChoiceField(queryset=Taxonomy.objects.all(), to_field_name="code", required=False)
+
+    class Meta:
+        model = Evaluation
+        fields = ["policies"]
+
+
+class EvaluationCostForm(ModelForm):
+    class Meta:
+        model = Evaluation
+        fields = ["cost"]
+
+
 class EvaluationShareForm(Form):
     is_final_report_published = BooleanField(label="Is final report published?", required=True)
     link_to_published_evaluation = URLField(max_length=1024, label="Link to published evaluation", required=False)
@@ -121,11 +231,18 @@ class EvaluationShareForm(Form):
                     )
 
 
-class EventDateForm(NamedErrorsModelForm):
+class EventDateForm(PreloadedEvaluationMixin, NamedErrorsModelForm):
     def __init__(self, *args, **kwargs):
         super(EventDateForm, self).__init__(*args, **kwargs)
         self.fields["month"].error_messages["invalid_choice"] = "Please enter a month number from 1-12"
 
+    def _get_validation_exclusions(self):
+        exclude = super()._get_validation_exclusions()
+        if isinstance(self.fields["evaluation"], PreloadedChoiceField):
+            # already checked against the loaded evaluation, skip the model's foreign-key existence query
+            exclude.add("evaluation")
+        return exclude
+
     def clean(self):
         super().clean()
         category = self.cleaned_data.get("category")
@@ -151,3 +268,54 @@ class EvaluationVisibilityForm(NamedErrorsModelForm):
     class Meta:
         model = Evaluation
         fields = ["visibility"]
+
+
+EVENT_DATE_FIELDS = ["evaluation", "month", "year", "other_description", "category"]
+
+
+class EventDateFormSet(BaseModelFormSet):
+    """validated against the dates it was given, and saved in bulk, so that its cost
+    does not grow with the number of dates
+    """
+
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        # the existing dates are already loaded, so look the submitted ids up among them
+        pk_name = self._pk_field.name
+        form.fields[pk_name] = PreloadedChoiceField(
+            self.get_queryset,
+            to_field_name="pk",
+            required=False,
+            initial=form.fields[pk_name].initial,
+            widget=form.fields[pk_name].widget,
+        )
+
+    def save_in_bulk(self) -> list[EventDate]:
+        """formset.save(), as one bulk insert and one bulk update in a transaction"""
+        event_dates = self.save(commit=False)
+        new_dates = [event_date for event_date in event_dates if event_date._state.adding]
+        changed_dates = [event_date for event_date in event_dates if not event_date._state.adding]
+
+        now = timezone.now()
+        for event_date in changed_dates:
+            event_date.modified_at = now  # bulk_update does not apply auto_now
+
+        with transaction.atomic():
+            EventDate.objects.bulk_create(new_dates)
+            EventDate.objects.bulk_update(changed_dates, fields=[*EVENT_DATE_FIELDS, "modified_at"])
+            if self.deleted_objects:
+                EventDate.objects.filter(pk__in=[event_date.pk for event_date in self.deleted_objects]).delete()
+        return event_dates
+
+
+# keyed by the number of blank forms: three to start with, then one to add another
+EVENT_DATE_FORMSETS = {
+    extra: modelformset_factory(
+        EventDate,
+        form=EventDateForm,
+        formset=EventDateFormSet,
+        fields=EVENT_DATE_FIELDS,
+        extra=extra,
+    )
+    for extra in (1, 3)
+}
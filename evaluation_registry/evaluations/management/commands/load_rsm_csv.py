@@ -2,15 +2,21 @@
 import csv
 
 # flake8: noqa
+import hashlib
 import json
 from collections import Counter
+from typing import IO, Callable, Iterator, NamedTuple, Optional
 
 from django.contrib.auth import get_user_model
 from django.core.management import BaseCommand
-from django.db import ProgrammingError
+from django.db import transaction
+from django.utils import timezone
+from simple_history.utils import (
+    bulk_create_with_history,
+    bulk_update_with_history,
+)
 
 from evaluation_registry.evaluations.models import (
-    Department,
     Evaluation,
     EvaluationDepartmentAssociation,
     EvaluationDesignType,
@@ -18,8 +24,9 @@ from evaluation_registry.evaluations.models import (
     EventDate,
     Report,
 )
+from evaluation_registry.evaluations.reference_data import get_departments
 
-DEPARTMENTS = {
+DEPARTMENTS: dict[Optional[str], list[str]] = {
     None: [],
     "Driver & vehicle standards agency": ["driver-and-vehicle-standards-agency"],
     "Department for transport": ["department-for-transport"],
@@ -440,11 +447,32 @@ MONTHS = {
 }
 
 
-def make_event_date(evaluation, kvp, category, key):
+# evaluations are written in transactions of this many, so a failure only loses the chunk it happens in
+CHUNK_SIZE = 500
+
+# the evaluation fields that come from an RSM row, and so are overwritten when that row changes
+RSM_EVALUATION_FIELDS = ["title", "brief_description", "visibility", "rsm_content_hash"]
+
+
+# the columns each imported EventDate is read from, each has a (Month) and a (Year) column
+EVENT_DATE_COLUMNS = (
+    (EventDate.Category.INTERVENTION_START_DATE, "Intervention start date"),
+    (EventDate.Category.INTERVENTION_END_DATE, "Intervention end date"),
+    (EventDate.Category.PUBLICATION_FINAL_RESULTS, "Publication date"),
+    (EventDate.Category.OTHER, "Event start date"),
+)
+
+ADMIN_EMAIL = "i-dot-ai-admin@cabinetoffice.gov.uk"
+
+# the largest value of the SmallIntegerFields that rsm_evaluation_id and rsm_report_id are stored in
+RSM_ID_MAX = 32767
+
+
+def make_event_date(evaluation, kvp, category, key) -> Optional[EventDate]:
     pub_month = MONTHS.get(kvp[f"{key} (Month)"])
     if year := kvp[f"{key} (Year)"]:
         try:
-            EventDate.objects.create(
+            return EventDate(
                 evaluation=evaluation,
                 month=pub_month,
                 year=int(year),
@@ -452,6 +480,91 @@ def make_event_date(evaluation, kvp, category, key):
             )
         except ValueError:
             pass
+    return None
+
+
+def is_major_project(record: dict) -> bool:
+    return record["\ufeffMajor projects identifier"] == "Y"
+
+
+def is_rsm_id(value: Optional[str]) -> bool:
+    """RSM ids are stored in SmallIntegerFields"""
+    if not value:
+        return False
+    return value.isascii() and value.isdigit() and int(value) <= RSM_ID_MAX
+
+
+def rejection_reason(record: dict) -> Optional[str]:
+    """why a row cannot be loaded, if it cannot"""
+    if not is_rsm_id(record["Evaluation ID"]):
+        return f'invalid evaluation id "{record["Evaluation ID"]}"'
+    if not is_rsm_id(record["Report ID"]):
+        return f'invalid report id "{record["Report ID"]}"'
+    if record["Evaluation title"] is None:
+        return "no title"
+    if record["Client"] and record["Client"] not in DEPARTMENTS:
+        return f'unknown client "{record["Client"]}"'
+    return None
+
+
+def record_warnings(record: dict) -> list[str]:
+    """anything in a loadable row that would be dropped from it"""
+    warnings = []
+    if len(record["gov_uk_link"] or "") > 1024:
+        warnings.append("gov_uk_link is longer than 1024 characters")
+    for _, key in EVENT_DATE_COLUMNS:
+        if (year := record[f"{key} (Year)"]) and not year.isdigit():
+            warnings.append(f'{key} has an unparseable year "{year}"')
+        if (month := record[f"{key} (Month)"]) and month not in MONTHS:
+            warnings.append(f'{key} has an unknown month "{month}"')
+    return warnings
+
+
+def record_hash(record: dict) -> str:
+    """digest of everything in a row, an evaluation whose row hashes the same as last time is left alone"""
+    # joined with ascii separators, as json-encoding a wide row costs more than everything else done with it
+    return hashlib.sha256("\x1e".join(f"{key}\x1f{value}" for key, value in record.items()).encode()).hexdigest()
+
+
+class CountingLines:
+    """the decoded lines of a binary file, keeping count of the byte offset reached.
+
+    Lines are read with readline, as iterating over a django File seeks back to the start.
+    """
+
+    def __init__(self, f: IO[bytes]):
+        self.f = f
+        self.offset = f.tell()
+
+    def __iter__(self) -> Iterator[str]:
+        for line in iter(self.f.readline, b""):
+            self.offset += len(line)
+            yield line.decode()
+
+
+def read_records(f: IO[bytes], start: int = 0) -> Iterator[tuple[dict, int]]:
+    """stream the rows of an RSM csv, each with the byte offset just past it. start must be
+    one of those offsets, so that an interrupted import can pick up where it stopped
+    """
+    f.seek(0)
+    lines = CountingLines(f)
+    fieldnames = next(csv.reader(lines), None)
+    if fieldnames is None:
+        return
+    if start:
+        f.seek(start)
+        lines.offset = start
+    # csv only reads as many lines as the row it returns, so the offset is always at a row boundary
+    for record in csv.DictReader(lines, fieldnames=fieldnames):
+        yield record, lines.offset
+
+
+class Checkpoint(NamedTuple):
+    """how far through a file an import has committed"""
+
+    offset: int
+    row: int
+    counts: dict
 
 
 class Command(BaseCommand):
@@ -459,35 +572,180 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument("file", type=str)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="validate the file and print, as json, what importing it would do, without writing anything",
+        )
 
     def handle(self, *args, **options):
         file = options["file"]
+        if options["dry_run"]:
+            with open(file, "rb") as f:
+                self.stdout.write(json.dumps(self.dry_run(f), indent=2))
+            return
+
         self.stdout.write(self.style.SUCCESS('loading "%s"' % file))
-        with open(file) as f:
-            records = list(csv.DictReader(f))
-        self.process_tabular_data(records)
+        with open(file, "rb") as f:
+            self.process_file(f)
+
+    def dry_run(self, f: IO[bytes]) -> dict:
+        """what importing the file would do, found with one pass over it and a single query.
+
+        Returns a summary of how many evaluations would be created, updated, left unchanged or deleted,
+        and how many rows would be skipped, rejected or ignored as duplicates, along with the ids for each,
+        except unchanged, and any rejection reasons or warnings by id.
+        """
+        existing = dict(
+            Evaluation.objects.filter(created_by__email=ADMIN_EMAIL, rsm_evaluation_id__isnull=False).values_list(
+                "rsm_evaluation_id", "rsm_content_hash"
+            )
+        )
+        occurrences: Counter = Counter()
+        outcomes: dict[str, tuple[str, list[str]]] = {}
+        for record, _ in read_records(f):
+            evaluation_id = record["Evaluation ID"]
+            occurrences[evaluation_id] += 1
+            if is_major_project(record):
+                outcomes[evaluation_id] = "skip", []
+            elif reason := rejection_reason(record):
+                outcomes[evaluation_id] = "reject", [reason]
+            elif int(evaluation_id) not in existing:
+                outcomes[evaluation_id] = "create", record_warnings(record)
+            elif existing[int(evaluation_id)] == record_hash(record):
+                outcomes[evaluation_id] = "unchanged", []
+            else:
+                outcomes[evaluation_id] = "update", record_warnings(record)
+
+        diff: dict[str, list] = {action: [] for action in ("create", "update", "delete", "skip", "reject", "duplicate")}
+        rejections, warnings = {}, {}
+        kept = set()
+        for evaluation_id, (action, messages) in outcomes.items():
+            if occurrences[evaluation_id] > 1:
+                action = "duplicate"
+            elif action == "reject":
+                rejections[evaluation_id] = messages
+            elif messages:
+                warnings[evaluation_id] = messages
+            if action in ("create", "update", "unchanged"):
+                kept.add(int(evaluation_id))
+            if action != "unchanged":
+                diff[action].append(evaluation_id)
+        diff["delete"] = sorted(str(rsm_evaluation_id) for rsm_evaluation_id in existing.keys() - kept)
 
-    def process_tabular_data(self, records: list[dict]):
-        """this only exists so that we can pass a s3 file in as an argument directly"""
-        admin, _ = get_user_model().objects.get_or_create(email="i-dot-ai-admin@cabinetoffice.gov.uk")
+        summary = {action: len(ids) for action, ids in diff.items()}
+        summary["unchanged"] = len(kept) - summary["create"] - summary["update"]
+        return {"summary": summary, "diff": diff, "rejections": rejections, "warnings": warnings}
 
-        Evaluation.objects.filter(created_by=admin).delete()
+    def process_file(
+        self,
+        f: IO[bytes],
+        resume_from: Optional[Checkpoint] = None,
+        on_checkpoint: Optional[Callable[[Checkpoint], None]] = None,
+    ) -> Counter:
+        """import a binary csv file, which may be a storage file so that an RSMFile can be passed in directly.
 
-        counts = Counter(x["Evaluation ID"] for x in records)
-        simple_evaluation_ids = {evaluation_id for evaluation_id, count in counts.items() if count == 1}
+        The file is streamed twice, once to find the ids to import and once to import them, so memory is bounded
+        by the number of ids rather than the size of the file. Evaluations are upserted on their RSM id:
+        unchanged rows are skipped, changed rows are updated in place and evaluations from an earlier import
+        that are no longer in the file are deleted.
 
-        for simple_evaluation_id in simple_evaluation_ids:
-            record = next(x for x in records if x["Evaluation ID"] == simple_evaluation_id)
+        on_checkpoint, if given, is called inside the transaction of each chunk, passing that checkpoint
+        back as resume_from restarts the import from the chunk after it.
+        """
+        admin, _ = get_user_model().objects.get_or_create(email=ADMIN_EMAIL)
+        departments = {department.code: department for department in get_departments()}
+        design_types = EvaluationDesignType.objects.tree()
+
+        kept_ids, skipped = self.find_importable_ids(f)
+
+        offset, row, counts = resume_from or Checkpoint(0, 0, {})
+        counts = Counter(counts)
+        counts["skipped"] = skipped
+
+        def commit(chunk: list[dict]):
+            with transaction.atomic():
+                self.import_chunk(chunk, admin, departments, design_types, counts)
+                if on_checkpoint:
+                    on_checkpoint(Checkpoint(offset, row, dict(counts)))
+            self.stdout.write(self.style.SUCCESS(f"Successfully processed {row} rows"))
+
+        chunk = []
+        for record, offset in read_records(f, start=offset):
+            row += 1
+            if record["Evaluation ID"] in kept_ids:
+                chunk.append(record)
+            if len(chunk) == CHUNK_SIZE:
+                commit(chunk)
+                chunk = []
+        if chunk:
+            commit(chunk)
+
+        with transaction.atomic():
+            _, deleted = (
+                Evaluation.objects.filter(created_by=admin)
+                .exclude(rsm_evaluation_id__in=[int(evaluation_id) for evaluation_id in kept_ids])
+                .delete()
+            )
+        counts["deleted"] = deleted.get(Evaluation._meta.label, 0)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Created {created}, updated {updated}, left {unchanged} unchanged, skipped {skipped} "
+                "and deleted {deleted} evaluations".format_map(counts)
+            )
+        )
+        return counts
+
+    def find_importable_ids(self, f: IO[bytes]) -> tuple[set[str], int]:
+        """the ids that appear exactly once in the file, on a row that can be imported,
+        and the number of those single rows that are skipped or rejected
+        """
+        occurrences: Counter = Counter()
+        rejections: dict[str, Optional[str]] = {}
+        for record, _ in read_records(f):
+            occurrences[record["Evaluation ID"]] += 1
+            if is_major_project(record):
+                rejections[record["Evaluation ID"]] = None
+            elif reason := rejection_reason(record):
+                rejections[record["Evaluation ID"]] = reason
+        single_ids = {evaluation_id for evaluation_id, n in occurrences.items() if n == 1}
+        for evaluation_id in single_ids & rejections.keys():
+            if reason := rejections[evaluation_id]:
+                self.stdout.write(self.style.WARNING(f'Rejecting evaluation "{evaluation_id}", {reason}'))
+        return single_ids - rejections.keys(), len(single_ids & rejections.keys())
+
+    def import_chunk(self, chunk: list[dict], admin, departments: dict, design_types, counts: Counter):
+        """build every object for the new and changed rows of a chunk in memory, then write each model in bulk.
+        Only rows that passed rejection_reason in find_importable_ids get here, so their ids parse
+        """
+        existing = {
+            rsm_evaluation_id: (pk, content_hash)
+            for rsm_evaluation_id, pk, content_hash in Evaluation.objects.filter(
+                created_by=admin, rsm_evaluation_id__in=[int(record["Evaluation ID"]) for record in chunk]
+            ).values_list("rsm_evaluation_id", "pk", "rsm_content_hash")
+        }
+        created, updated, reports, design_type_details, event_dates, department_associations = [], [], [], [], [], []
+
+        def add_design_type(evaluation, code, text=None):
+            if design_type := design_types.get(code):
+                design_type_details.append(
+                    EvaluationDesignTypeDetail(evaluation=evaluation, design_type=design_type, text=text)
+                )
+            else:
+                self.stdout.write(self.style.WARNING(f'Unknown design type "{code}", skipping it'))
+
+        for record in chunk:
+            simple_evaluation_id = record["Evaluation ID"]
             published_evaluation_link = record["gov_uk_link"]
 
             if len(published_evaluation_link or "") > 1024:
                 published_evaluation_link = None
 
-            if record["\ufeffMajor projects identifier"] == "Y":
-                continue
-
-            if record["Evaluation title"] is None:
-                self.stdout.write(self.style.WARNING(f"No title found, skipping evaluation"))
+            content_hash = record_hash(record)
+            pk, previous_hash = existing.pop(int(simple_evaluation_id), (None, None))
+            if content_hash == previous_hash:
+                counts["unchanged"] += 1
                 continue
 
             is_other_type = record["Other evaluation type (please state)"] not in (
@@ -495,76 +753,101 @@ class Command(BaseCommand):
                 "Information not easily found within the report",
                 "N",
             )
-            evaluation = Evaluation.objects.create(
+            evaluation = Evaluation(
                 created_by=admin,
                 rsm_evaluation_id=simple_evaluation_id,
                 title=record["Evaluation title"],
                 brief_description=record["Evaluation summary"],
                 visibility=Evaluation.Visibility.PUBLIC,
+                rsm_content_hash=content_hash,
             )
+            if pk:
+                evaluation.pk = pk
+                updated.append(evaluation)
+            else:
+                created.append(evaluation)
 
-            Report.objects.create(
-                title=record["Report title"],
-                link=published_evaluation_link,
-                rsm_report_id=record["Report ID"],
-                evaluation=evaluation,
+            reports.append(
+                Report(
+                    title=record["Report title"],
+                    link=published_evaluation_link,
+                    rsm_report_id=int(record["Report ID"]),
+                    evaluation=evaluation,
+                )
             )
 
             for evaluation_type in "Process", "Impact", "Economic":
                 if record[evaluation_type] == "Y":
-                    EvaluationDesignTypeDetail.objects.create(
-                        evaluation=evaluation,
-                        design_type=EvaluationDesignType.objects.get(code=evaluation_type.lower()),
-                    )
+                    add_design_type(evaluation, evaluation_type.lower())
 
             if record["Impact"] == "Y":
                 if design_type := DESIGN_TYPES.get(record["Impact - Design"]):
-                    EvaluationDesignTypeDetail.objects.create(
-                        evaluation=evaluation,
-                        design_type=EvaluationDesignType.objects.get(code=design_type),
-                    )
+                    add_design_type(evaluation, design_type)
                 else:
-                    EvaluationDesignTypeDetail.objects.create(
-                        evaluation=evaluation,
-                        design_type=EvaluationDesignType.objects.get(code="other"),
-                        text=record["Impact - Design"][:1024],
-                    )
+                    add_design_type(evaluation, "other", text=record["Impact - Design"][:1024])
 
             if is_other_type:
-                EvaluationDesignTypeDetail.objects.create(
-                    evaluation=evaluation,
-                    design_type=EvaluationDesignType.objects.get(code="other"),
-                    text=record["Other evaluation type (please state)"],
-                )
+                add_design_type(evaluation, "other", text=record["Other evaluation type (please state)"])
 
-            make_event_date(
-                evaluation,
-                record,
-                EventDate.Category.INTERVENTION_START_DATE,
-                "Intervention start date",
-            )
-            make_event_date(
-                evaluation,
-                record,
-                EventDate.Category.INTERVENTION_END_DATE,
-                "Intervention end date",
-            )
-            make_event_date(
-                evaluation,
-                record,
-                EventDate.Category.PUBLICATION_FINAL_RESULTS,
-                "Publication date",
-            )
-            make_event_date(evaluation, record, EventDate.Category.OTHER, "Event start date")
+            for category, key in EVENT_DATE_COLUMNS:
+                if event_date := make_event_date(evaluation, record, category, key):
+                    event_dates.append(event_date)
 
-            self.stdout.write(self.style.SUCCESS('Successfully created Evaluation "%s"' % record["Evaluation title"]))
+            for code in DEPARTMENTS[record["Client"] or None]:
+                if department := departments.get(code):
+                    department_associations.append(
+                        EvaluationDepartmentAssociation(evaluation=evaluation, department=department)
+                    )
 
-            if not record["Client"]:
-                continue
+        # bulk writes bypass Evaluation.save, so history and search vectors are written here
+        bulk_create_with_history(created, Evaluation, default_user=admin)
+        if updated:
+            self.update_evaluations(updated, admin)
+            reports = self.match_reports(reports, [evaluation.pk for evaluation in updated])
+        Evaluation.objects.filter(pk__in=[evaluation.pk for evaluation in created + updated]).update_search_vector()
+        Report.objects.bulk_create(reports)
+        EvaluationDesignTypeDetail.objects.bulk_create(design_type_details)
+        EventDate.objects.bulk_create(event_dates)
+        EvaluationDepartmentAssociation.objects.bulk_create(department_associations)
 
-            for department in Department.objects.filter(code__in=DEPARTMENTS[record["Client"]]):
-                EvaluationDepartmentAssociation.objects.create(
-                    evaluation=evaluation,
-                    department=department,
-                )
-                self.stdout.write(self.style.SUCCESS(f'Associated "{evaluation.title}" with "{department.display}"'))
+        counts["created"] += len(created)
+        counts["updated"] += len(updated)
+
+    def update_evaluations(self, evaluations: list[Evaluation], admin):
+        """copy the imported fields onto the stored evaluations, so that their history rows are complete,
+        and clear the children that are rebuilt from the row
+        """
+        pks = [evaluation.pk for evaluation in evaluations]
+        stored = Evaluation.objects.in_bulk(pks)
+        now = timezone.now()
+        for evaluation in evaluations:
+            for field in RSM_EVALUATION_FIELDS:
+                setattr(stored[evaluation.pk], field, getattr(evaluation, field))
+            stored[evaluation.pk].modified_at = now
+        bulk_update_with_history(
+            list(stored.values()), Evaluation, [*RSM_EVALUATION_FIELDS, "modified_at"], default_user=admin
+        )
+
+        EvaluationDesignTypeDetail.objects.filter(evaluation__in=pks).delete()
+        EventDate.objects.filter(evaluation__in=pks).delete()
+        EvaluationDepartmentAssociation.objects.filter(evaluation__in=pks).delete()
+
+    def match_reports(self, reports: list[Report], evaluation_pks: list) -> list[Report]:
+        """update the stored reports of changed evaluations in place, matched on their RSM id,
+        delete those no longer in the file and return the ones that still need creating
+        """
+        stored = {
+            (report.evaluation_id, report.rsm_report_id): report
+            for report in Report.objects.filter(evaluation__in=evaluation_pks)
+        }
+        new_reports, changed_reports = [], []
+        now = timezone.now()
+        for report in reports:
+            if stored_report := stored.pop((report.evaluation_id, report.rsm_report_id), None):
+                stored_report.title, stored_report.link, stored_report.modified_at = report.title, report.link, now
+                changed_reports.append(stored_report)
+            else:
+                new_reports.append(report)
+        Report.objects.bulk_update(changed_reports, ["title", "link", "modified_at"])
+        Report.objects.filter(pk__in=[report.pk for report in stored.values()]).delete()
+        return new_reports
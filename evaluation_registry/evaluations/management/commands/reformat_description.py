@@ -1,10 +1,23 @@
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterable, Optional
+
+import openai
+from django.conf import settings
+from django.core.cache import caches
 from django.core.management import BaseCommand
+from django.utils import timezone
 from openai import OpenAI
+from simple_history.utils import bulk_update_with_history
 from tqdm import tqdm
 
-from evaluation_registry import settings
 from evaluation_registry.evaluations.models import Evaluation
 
+logger = logging.getLogger(__name__)
+
 CHATGPT_ROLE = """
 You are a plain text formatter.
 
@@ -19,31 +32,125 @@ Do not:
 Please return the reformatted text without explanation.
 """
 
-client = OpenAI(api_key=settings.OPENAI_KEY)
+CHATGPT_MODEL = "gpt-3.5-turbo"
+
+# evaluations are reformatted, and saved, this many at a time
+BATCH_SIZE = 100
+
+
+def get_client() -> OpenAI:
+    """the client retries rate-limited, failed and timed out requests itself, with exponential backoff"""
+    return OpenAI(
+        api_key=settings.OPENAI_KEY, base_url=settings.OPENAI_BASE_URL, max_retries=settings.OPENAI_MAX_RETRIES
+    )
+
 
+def reformat_cache_key(txt: str) -> str:
+    """the same text, with the same prompt and model, is only ever sent once"""
+    digest = hashlib.sha256(f"{CHATGPT_MODEL}\x1f{CHATGPT_ROLE}\x1f{txt}".encode()).hexdigest()
+    return f"reformat-text:{digest}"
 
-def reformat_text(txt: str | None) -> str | None:
+
+def reformat_text(txt: str | None, client: Optional[OpenAI] = None) -> str | None:
     if not txt:
         return txt
 
-    chat_completion = client.chat.completions.create(
+    chat_completion = (client or get_client()).chat.completions.create(
         messages=[
             {"role": "system", "content": CHATGPT_ROLE},
             {"role": "user", "content": txt},
         ],
-        model="gpt-3.5-turbo",
+        model=CHATGPT_MODEL,
     )
     if not chat_completion.choices:
         raise ValueError("no data returned")
     return chat_completion.choices[0].message.content
 
 
-def reformat_evaluation(evaluation: Evaluation):
-    new_title = reformat_text(evaluation.title)
-    if new_title and len(new_title) <= 1024:
-        evaluation.title = new_title
-    evaluation.brief_description = reformat_text(evaluation.brief_description)
-    evaluation.save()
+class TokenBucket:
+    """thread-safe token bucket, acquire blocks until a token is free, so that at most
+    capacity requests are made in a burst and no more than rate per second after that
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            # the token is taken now, a negative balance is the queue of callers waiting for theirs
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        time.sleep(wait)
+
+
+class TextReformatter:
+    """reformats many texts at once: texts in the "reformat" cache are not sent, the same text is only sent
+    once, and the rest are sent concurrently, within the rate limit
+    """
+
+    def __init__(
+        self,
+        concurrency: Optional[int] = None,
+        requests_per_minute: Optional[int] = None,
+        client: Optional[OpenAI] = None,
+    ):
+        self.concurrency = concurrency or settings.OPENAI_CONCURRENCY
+        requests_per_minute = requests_per_minute or settings.OPENAI_REQUESTS_PER_MINUTE
+        self.bucket = TokenBucket(requests_per_minute / 60, capacity=self.concurrency)
+        self.client = client or get_client()
+
+    def reformat_many(self, texts: Iterable[str | None]) -> dict[str, str]:
+        """reformatted text by original, texts that could not be reformatted are left out"""
+        keys = {txt: reformat_cache_key(txt) for txt in texts if txt}
+        cached = caches["reformat"].get_many(keys.values())
+        reformatted: dict[str, str] = {}
+        for txt, key in keys.items():
+            if isinstance(cached_txt := cached.get(key), str):
+                reformatted[txt] = cached_txt
+
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            futures = {pool.submit(self.reformat, txt, keys[txt]): txt for txt in keys.keys() - reformatted.keys()}
+            for future in as_completed(futures):
+                try:
+                    reformatted[futures[future]] = future.result()
+                except (openai.OpenAIError, ValueError):
+                    logger.warning("could not reformat text", exc_info=True)
+        return reformatted
+
+    def reformat(self, txt: str, key: str) -> str:
+        self.bucket.acquire()
+        new_txt = reformat_text(txt, client=self.client)
+        if not new_txt:
+            raise ValueError("no text returned")
+        # cached as each one arrives, so that a run that is stopped part way loses nothing
+        caches["reformat"].set(key, new_txt)
+        return new_txt
+
+
+def reformat_evaluations(evaluations: Iterable[Evaluation], reformatter: TextReformatter, user=None) -> int:
+    """reformat the title and description of each evaluation, then save them together"""
+    evaluations = list(evaluations)
+    reformatted = reformatter.reformat_many(
+        txt for evaluation in evaluations for txt in (evaluation.title, evaluation.brief_description)
+    )
+    now = timezone.now()
+    for evaluation in evaluations:
+        evaluation.modified_at = now
+        if evaluation.title and (new_title := reformatted.get(evaluation.title)) and len(new_title) <= 1024:
+            evaluation.title = new_title
+        if evaluation.brief_description:
+            evaluation.brief_description = reformatted.get(evaluation.brief_description, evaluation.brief_description)
+
+    bulk_update_with_history(evaluations, Evaluation, ["title", "brief_description", "modified_at"], default_user=user)
+    Evaluation.objects.filter(pk__in=[evaluation.pk for evaluation in evaluations]).update_search_vector()
+    return len(evaluations)
 
 
 class Command(BaseCommand):
@@ -51,17 +158,25 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument("max_number_to_process", type=int, nargs="?", default=None)
+        parser.add_argument("--concurrency", type=int, default=None, help="requests made at once")
+        parser.add_argument("--requests-per-minute", type=int, default=None)
 
     def handle(self, *args, **options):
         max_number_to_process = options["max_number_to_process"] or Evaluation.objects.count()
+        reformatter = TextReformatter(options["concurrency"], options["requests_per_minute"])
 
-        progress_bar = tqdm(desc="Processing", total=max_number_to_process)
-        for evaluation in Evaluation.objects.filter(rsm_evaluation_id__isnull=False).order_by("rsm_evaluation_id")[
+        evaluations = Evaluation.objects.filter(rsm_evaluation_id__isnull=False).order_by("rsm_evaluation_id")[
             :max_number_to_process
-        ]:
-            progress_bar.set_description(f"updating rsm-evaluation-id: {evaluation.rsm_evaluation_id}")
-            reformat_evaluation(evaluation)
-            progress_bar.update(1)
+        ]
+        progress_bar = tqdm(desc="Processing", total=max_number_to_process)
+        batch: list[Evaluation] = []
+        for evaluation in evaluations.iterator(chunk_size=BATCH_SIZE):
+            batch.append(evaluation)
+            if len(batch) == BATCH_SIZE:
+                progress_bar.update(reformat_evaluations(batch, reformatter))
+                batch = []
+        if batch:
+            progress_bar.update(reformat_evaluations(batch, reformatter))
 
         progress_bar.close()
         self.stdout.write(self.style.SUCCESS("reformatting text complete"))
@@ -0,0 +1,103 @@
+import datetime
+import signal
+import time
+import traceback
+
+from django.core.management import BaseCommand
+from django.db.models import F
+from django.utils import timezone
+
+from evaluation_registry.evaluations.management.commands import load_rsm_csv
+from evaluation_registry.evaluations.models import (
+    RSM_IMPORT_STALE_AFTER,
+    RSMFile,
+)
+
+# a job whose worker dies during it is retried, until it has been tried this many times and is marked failed.
+# An import that raises an error is marked failed straight away. Failed jobs are never retried by the worker,
+# they only run again when they are queued again from the admin
+MAX_ATTEMPTS = 3
+
+
+def raise_system_exit(signum, frame):
+    raise SystemExit(128 + signum)
+
+
+class Command(BaseCommand):
+    help = "Run queued RSM imports, polling the database for new ones"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="exit once the queue is empty")
+        parser.add_argument("--poll-interval", type=float, default=5, help="seconds to wait between polls")
+        parser.add_argument(
+            "--stale-after",
+            type=int,
+            default=int(RSM_IMPORT_STALE_AFTER.total_seconds()),
+            help="seconds without a heartbeat before a running job is retried",
+        )
+
+    def handle(self, *args, **options):
+        stale_after = datetime.timedelta(seconds=options["stale_after"])
+        # docker stop and Elastic Beanstalk stop the worker with SIGTERM, which python does not turn into
+        # an exception by default, so that the running job is handed back as it is on Ctrl-C
+        previous_handler = signal.signal(signal.SIGTERM, raise_system_exit)
+        try:
+            while True:
+                rsm_file = RSMFile.objects.claim_next(timezone.now() - stale_after, MAX_ATTEMPTS)
+                if rsm_file:
+                    self.run_import(rsm_file)
+                elif options["once"]:
+                    return
+                else:
+                    time.sleep(options["poll_interval"])
+        finally:
+            signal.signal(signal.SIGTERM, previous_handler)
+
+    def run_import(self, rsm_file: RSMFile):
+        self.stdout.write(self.style.SUCCESS(f'importing "{rsm_file}", attempt {rsm_file.attempts}'))
+
+        def record_checkpoint(checkpoint: load_rsm_csv.Checkpoint):
+            RSMFile.objects.filter(pk=rsm_file.pk).update(
+                checkpoint_offset=checkpoint.offset,
+                rows_processed=checkpoint.row,
+                import_counts=checkpoint.counts,
+                heartbeat_at=timezone.now(),
+            )
+
+        resume_from = None
+        if rsm_file.checkpoint_offset:
+            resume_from = load_rsm_csv.Checkpoint(
+                rsm_file.checkpoint_offset, rsm_file.rows_processed, rsm_file.import_counts
+            )
+            self.stdout.write(f"resuming from row {rsm_file.rows_processed}")
+
+        try:
+            importer = load_rsm_csv.Command()
+            importer.stdout = self.stdout
+            with rsm_file.csv.open("rb") as f:
+                counts = importer.process_file(f, resume_from=resume_from, on_checkpoint=record_checkpoint)
+        except (KeyboardInterrupt, SystemExit):
+            # an interrupted or terminated worker hands its job straight back, rather than leaving it to go stale,
+            # and the attempt does not count against it, so that a few deploys during an import do not use them up
+            RSMFile.objects.filter(pk=rsm_file.pk).update(status=RSMFile.Status.QUEUED, attempts=F("attempts") - 1)
+            raise
+        except Exception:  # noqa: B902, any failure is recorded on the job rather than killing the worker
+            self.stderr.write(f'import of "{rsm_file}" failed')
+            rsm_file.status = RSMFile.Status.FAILED
+            rsm_file.error = traceback.format_exc()
+            rsm_file.finished_at = timezone.now()
+            rsm_file.save(update_fields=["status", "error", "finished_at", "modified_at"])
+            return
+
+        rsm_file.status = RSMFile.Status.SUCCEEDED
+        rsm_file.import_counts = dict(counts)
+        rsm_file.finished_at = rsm_file.last_successfully_loaded_at = timezone.now()
+        rsm_file.save(
+            update_fields=[
+                "status",
+                "import_counts",
+                "finished_at",
+                "last_successfully_loaded_at",
+                "modified_at",
+            ]
+        )
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:40
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+
+def populate_search_vector(apps, schema_editor):
+    Evaluation = apps.get_model("evaluations", "Evaluation")
+
+    Evaluation.objects.update(
+        search_vector=SearchVector("title", weight="A") + SearchVector("brief_description", weight="B")
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("evaluations", "0009_alter_evaluationdesigntype_managers"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="evaluation",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="evaluation",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="evaluation_search_vector_idx"
+            ),
+        ),
+        migrations.RunPython(populate_search_vector, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("evaluations", "0010_evaluation_search_vector"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="evaluationdepartmentassociation",
+            index=models.Index(fields=["department", "evaluation"], name="dept_assoc_department_eval_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="evaluationdesigntypedetail",
+            index=models.Index(fields=["evaluation", "design_type"], name="design_detail_eval_type_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="evaluationdesigntypedetail",
+            index=models.Index(fields=["design_type", "evaluation"], name="design_detail_type_eval_idx"),
+        ),
+    ]
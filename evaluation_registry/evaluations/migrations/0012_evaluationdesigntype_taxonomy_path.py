@@ -0,0 +1,57 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:48
+
+from django.db import migrations, models
+
+
+def populate_paths(apps, schema_editor):
+    for model_name in "EvaluationDesignType", "Taxonomy":
+        model = apps.get_model("evaluations", model_name)
+        choices = {choice.id: choice for choice in model._default_manager.all()}
+
+        def get_path(choice):
+            parent_path = get_path(choices[choice.parent_id]) if choice.parent_id else ""
+            return f"{parent_path}{choice.code}/"
+
+        for choice in choices.values():
+            choice.path = get_path(choice)
+        model._default_manager.bulk_update(choices.values(), ["path"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("evaluations", "0011_facet_filter_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="evaluationdesigntype",
+            name="path",
+            field=models.CharField(
+                default="",
+                editable=False,
+                help_text="materialised path of codes from the root, e.g. impact/rct/cluster/",
+                max_length=1024,
+            ),
+        ),
+        migrations.AddField(
+            model_name="taxonomy",
+            name="path",
+            field=models.CharField(
+                default="",
+                editable=False,
+                help_text="materialised path of codes from the root, e.g. impact/rct/cluster/",
+                max_length=1024,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="evaluationdesigntype",
+            index=models.Index(
+                fields=["path"], name="evaluationdesigntype_path_idx", opclasses=["varchar_pattern_ops"]
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="taxonomy",
+            index=models.Index(fields=["path"], name="taxonomy_path_idx", opclasses=["varchar_pattern_ops"]),
+        ),
+        migrations.RunPython(populate_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:52
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """the auto-created evaluation-policies table only has the (evaluation, taxonomy) unique index
+    and single-column foreign-key indexes, add the reverse composite so that filtering evaluations
+    by policy-area is an index-only probe
+    """
+
+    dependencies = [
+        ("evaluations", "0012_evaluationdesigntype_taxonomy_path"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            "CREATE INDEX IF NOT EXISTS evaluation_policies_taxonomy_eval_idx "
+            "ON evaluations_evaluation_policies (taxonomy_id, evaluation_id);",
+            "DROP INDEX IF EXISTS evaluation_policies_taxonomy_eval_idx;",
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def populate_lead_department(apps, schema_editor):
+    Evaluation = apps.get_model("evaluations", "Evaluation")
+    EvaluationDepartmentAssociation = apps.get_model("evaluations", "EvaluationDepartmentAssociation")
+
+    Evaluation.objects.update(
+        lead_department=Subquery(
+            EvaluationDepartmentAssociation.objects.filter(evaluation=OuterRef("pk"), is_lead=True).values(
+                "department"
+            )[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("evaluations", "0013_evaluation_policies_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="evaluation",
+            name="lead_department",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                help_text="denormalised from the lead EvaluationDepartmentAssociation, kept in step by its signals",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="led_evaluations",
+                to="evaluations.department",
+            ),
+        ),
+        migrations.RunPython(populate_lead_department, migrations.RunPython.noop),
+    ]
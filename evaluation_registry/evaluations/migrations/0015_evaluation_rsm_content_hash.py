@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("evaluations", "0014_evaluation_lead_department"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="evaluation",
+            name="rsm_content_hash",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                help_text="digest of the RSM row this was last imported from, unchanged rows are skipped on re-import",
+                max_length=64,
+                null=True,
+            ),
+        ),
+    ]
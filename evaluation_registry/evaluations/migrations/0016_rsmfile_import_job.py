@@ -0,0 +1,75 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("evaluations", "0015_evaluation_rsm_content_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="rsmfile",
+            name="attempts",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="rsmfile",
+            name="error",
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="rsmfile",
+            name="finished_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="rsmfile",
+            name="heartbeat_at",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="written by the worker after every chunk, a stale heartbeat means it died",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="rsmfile",
+            name="import_counts",
+            field=models.JSONField(blank=True, default=dict, help_text="evaluations created, updated, etc."),
+        ),
+        migrations.AddField(
+            model_name="rsmfile",
+            name="queued_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="rsmfile",
+            name="rows_processed",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="rsmfile",
+            name="started_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="rsmfile",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("uploaded", "Uploaded"),
+                    ("queued", "Queued"),
+                    ("running", "Running"),
+                    ("succeeded", "Succeeded"),
+                    ("failed", "Failed"),
+                ],
+                default="uploaded",
+                max_length=16,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="rsmfile",
+            index=models.Index(fields=["status", "queued_at"], name="rsm_file_status_queued_idx"),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("evaluations", "0016_rsmfile_import_job"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="rsmfile",
+            name="checkpoint_offset",
+            field=models.PositiveBigIntegerField(
+                default=0, help_text="byte offset in the file just past the last committed row, a retry resumes here"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="rsmfile",
+            name="rows_processed",
+            field=models.PositiveIntegerField(default=0, help_text="rows of the file committed so far"),
+        ),
+    ]
@@ -1,12 +1,19 @@
 import calendar
+import datetime
 import uuid
 from typing import Optional
 
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Concat, Substr
 from django.db.models.query import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
 from django_use_email_as_username.models import BaseUser, BaseUserManager
 from simple_history.models import HistoricalRecords
 
@@ -58,6 +65,14 @@ class AbstractChoiceManager(models.Manager):
     def get_queryset(self):
         return super().get_queryset().select_related("parent").order_by("code")
 
+    def tree(self):
+        """in-process index of the whole hierarchy, rebuilt when the reference data changes"""
+        from evaluation_registry.evaluations.reference_data import (
+            get_choice_tree,
+        )
+
+        return get_choice_tree(self.model)
+
 
 class AbstractChoice(TimeStampedModel):
     objects = AbstractChoiceManager()
@@ -69,12 +84,34 @@ class AbstractChoice(TimeStampedModel):
     )
     display = models.CharField(max_length=512, help_text="display name")
     parent = models.ForeignKey("self", related_name="children", on_delete=models.CASCADE, blank=True, null=True)
+    parent_id: Optional[uuid.UUID]
+    path = models.CharField(
+        max_length=1024,
+        default="",
+        editable=False,
+        help_text="materialised path of codes from the root, e.g. impact/rct/cluster/",
+    )
 
     def __str__(self):
         return self.display
 
+    def save(self, *args, **kwargs):
+        old_path = self.path
+        self.path = f"{self.parent.path if self.parent else ''}{self.code}/"
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "path"}
+
+        # atomic, so that a failed save leaves the subtree's paths as they were
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if old_path and old_path != self.path:  # re-root the subtree under the new path
+                type(self).objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                    path=Concat(Value(self.path), Substr("path", len(old_path) + 1))
+                )
+
     class Meta:
         abstract = True
+        indexes = [models.Index(fields=["path"], name="%(class)s_path_idx", opclasses=["varchar_pattern_ops"])]
 
 
 class EvaluationDesignType(AbstractChoice):
@@ -87,10 +124,63 @@ class EvaluationDesignType(AbstractChoice):
 
 class Taxonomy(AbstractChoice):
     def __str__(self):
-        return f"{self.parent} > {self.display}" if self.parent else self.display
+        parent = None
+        if self.parent_id:
+            # avoid a lazy-load of the parent when it was not select_related
+            if not Taxonomy.parent.is_cached(self):
+                parent = Taxonomy.objects.tree().parent(self.code)
+            parent = parent or self.parent
+        return f"{parent} > {self.display}" if parent else self.display
+
+
+# weighted full-text-search document, persisted on Evaluation.search_vector
+EVALUATION_SEARCH_VECTOR = SearchVector("title", weight="A") + SearchVector("brief_description", weight="B")
+EVALUATION_SEARCH_FIELDS = {"title", "brief_description"}
+
+
+def evaluation_search_vector(title: Optional[str], brief_description: Optional[str]) -> SearchVector:
+    """EVALUATION_SEARCH_VECTOR of in-memory values, rather than of the stored columns"""
+    return SearchVector(Value(title, output_field=models.TextField()), weight="A") + SearchVector(
+        Value(brief_description, output_field=models.TextField()), weight="B"
+    )
+
+
+class EvaluationQuerySet(models.QuerySet):
+    def update_search_vector(self) -> int:
+        """recompute the stored search-vector for every evaluation in this queryset,
+        use this after bulk_create/update as these bypass Evaluation.save
+        """
+        return self.update(search_vector=EVALUATION_SEARCH_VECTOR)
+
+    def update_lead_department(self) -> int:
+        """recompute the denormalised lead department for every evaluation in this queryset,
+        use this after bulk_create/update of EvaluationDepartmentAssociation as these bypass its signals
+        """
+        return self.update(lead_department=lead_department_subquery())
+
+    def with_detail(self) -> "EvaluationQuerySet":
+        """everything the detail page needs, in one query per relation rather than per use,
+        the Evaluation properties below read from these prefetched lists when present
+        """
+        return self.select_related("lead_department").prefetch_related(
+            models.Prefetch(
+                "evaluationdepartmentassociation_set",
+                queryset=EvaluationDepartmentAssociation.objects.filter(is_lead=False)
+                .select_related("department")
+                .order_by("department__display"),
+                to_attr="department_associations",
+            ),
+            models.Prefetch(
+                "evaluationdesigntypedetail_set",
+                queryset=EvaluationDesignTypeDetail.objects.select_related("design_type").order_by("design_type__code"),
+                to_attr="design_type_details",
+            ),
+            "policies",
+            "event_dates",
+        )
 
 
-class EvaluationManager(models.Manager):
+class EvaluationManager(models.Manager.from_queryset(EvaluationQuerySet)):  # type: ignore
     def get_queryset(self) -> QuerySet:
         qs = (
             super()
@@ -130,9 +220,25 @@ class Evaluation(TimeStampedModel):
         through="EvaluationDepartmentAssociation",
         help_text="departments involved in this evaluation",
     )
+    lead_department = models.ForeignKey(
+        Department,
+        on_delete=models.SET_NULL,
+        related_name="led_evaluations",
+        blank=True,
+        null=True,
+        editable=False,
+        help_text="denormalised from the lead EvaluationDepartmentAssociation, kept in step by its signals",
+    )
     status = models.CharField(max_length=512, choices=Status.choices, blank=True, null=True)
     # For matching with initial data upload from RSM - evaluation id
     rsm_evaluation_id = models.SmallIntegerField(blank=True, null=True, unique=True)
+    rsm_content_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        null=True,
+        editable=False,
+        help_text="digest of the RSM row this was last imported from, unchanged rows are skipped on re-import",
+    )
 
     evaluation_design_types = models.ManyToManyField(  # type: ignore
         EvaluationDesignType, through="EvaluationDesignTypeDetail", help_text="add more text for 'Other' Design Types"
@@ -157,18 +263,37 @@ class Evaluation(TimeStampedModel):
     )
     reasons_unpublished_details = models.TextField(blank=True, null=True, max_length=4096)
     cost = models.CharField(blank=True, null=True, max_length=50)
+    search_vector = SearchVectorField(null=True, editable=False)
 
-    history = HistoricalRecords()
+    # lead_department is written by the association signals, after the history row, so history would record it stale
+    history = HistoricalRecords(excluded_fields=["search_vector", "rsm_content_hash", "lead_department"])
 
-    @property
-    def lead_department(self) -> Optional[Department]:
-        try:
-            return self.departments.get(evaluationdepartmentassociation__is_lead=True)
-        except ObjectDoesNotExist:
-            return None
+    class Meta:
+        indexes = [GinIndex(fields=["search_vector"], name="evaluation_search_vector_idx")]
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None and not self._state.adding and not kwargs.get("force_insert"):
+            # lead_department is kept by the association signals, a stale in-memory value must not overwrite it
+            update_fields = (
+                {field.name for field in self._meta.concrete_fields if not field.primary_key}
+                - self.get_deferred_fields()
+                - {"lead_department"}
+            )
+            kwargs["update_fields"] = update_fields
+        if update_fields is None or EVALUATION_SEARCH_FIELDS.intersection(update_fields):
+            # built from the values being saved, so that it is written in the same statement as them
+            self.search_vector = evaluation_search_vector(self.title, self.brief_description)
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "search_vector"}
+        super().save(*args, **kwargs)
+        # what was written is an expression, so the field is read back from the database if it is used
+        self.__dict__.pop("search_vector", None)
 
     @property
     def other_departments(self):
+        if hasattr(self, "department_associations"):  # prefetched, see EvaluationQuerySet.with_detail
+            return [a.department for a in self.department_associations]
         try:
             return self.departments.filter(evaluationdepartmentassociation__is_lead=False)
         except ObjectDoesNotExist:
@@ -176,6 +301,10 @@ class Evaluation(TimeStampedModel):
 
     @property
     def types_text_list(self):
+        if hasattr(self, "root_design_types"):  # prefetched, see views.prefetch_search_results
+            return [t.display for t in self.root_design_types]
+        if hasattr(self, "design_type_details"):
+            return [d.design_type.display for d in self.design_type_details if d.design_type.parent_id is None]
         return [t.display for t in self.evaluation_design_types.filter(parent__isnull=True)]
 
     @property
@@ -184,6 +313,8 @@ class Evaluation(TimeStampedModel):
 
     @property
     def other_design_types(self):
+        if hasattr(self, "design_type_details"):
+            return [d for d in self.design_type_details if d.design_type.code == "other"]
         return self.evaluationdesigntypedetail_set.filter(design_type__code="other")
 
     def get_reasons_unpublished_text(self) -> list[str]:
@@ -214,6 +345,34 @@ class EvaluationDepartmentAssociation(models.Model):
                 fields=["evaluation"], condition=models.Q(is_lead=True), name="unique-lead-department"
             ),
         ]
+        indexes = [models.Index(fields=["department", "evaluation"], name="dept_assoc_department_eval_idx")]
+
+
+def lead_department_subquery() -> Subquery:
+    return Subquery(
+        EvaluationDepartmentAssociation.objects.filter(evaluation=OuterRef("pk"), is_lead=True).values("department")[:1]
+    )
+
+
+def sync_lead_department(sender, instance, **kwargs):
+    """keep Evaluation.lead_department in step with its lead association"""
+    if isinstance(kwargs.get("origin"), (Evaluation, EvaluationQuerySet)):
+        return  # the evaluation itself is being deleted
+    if not instance.is_lead and (kwargs.get("created") or kwargs["signal"] is post_delete):
+        return  # adding or removing another department cannot change the lead
+
+    Evaluation.objects.filter(pk=instance.evaluation_id).update_lead_department()
+
+    if EvaluationDepartmentAssociation.evaluation.is_cached(instance):
+        evaluation = instance.evaluation
+        if instance.is_lead and kwargs["signal"] is post_save:
+            evaluation.lead_department_id = instance.department_id
+        elif evaluation.lead_department_id == instance.department_id:
+            evaluation.lead_department_id = None
+
+
+post_save.connect(sync_lead_department, sender=EvaluationDepartmentAssociation, dispatch_uid="lead-department-save")
+post_delete.connect(sync_lead_department, sender=EvaluationDepartmentAssociation, dispatch_uid="lead-department-delete")
 
 
 class EvaluationDesignTypeDetail(models.Model):
@@ -225,12 +384,19 @@ class EvaluationDesignTypeDetail(models.Model):
     design_type = models.ForeignKey(EvaluationDesignType, on_delete=models.CASCADE)
     text = models.CharField(max_length=1024, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["evaluation", "design_type"], name="design_detail_eval_type_idx"),
+            models.Index(fields=["design_type", "evaluation"], name="design_detail_type_eval_idx"),
+        ]
+
 
 class Report(TimeStampedModel):
     title = models.CharField(max_length=1024, blank=True, null=True)
     link = models.URLField(max_length=1024, blank=True, null=True)
     rsm_report_id = models.SmallIntegerField(blank=True, null=True)
     evaluation = models.ForeignKey(Evaluation, on_delete=models.CASCADE)
+    evaluation_id: uuid.UUID
 
 
 class EventDate(TimeStampedModel):
@@ -286,8 +452,107 @@ class EventDate(TimeStampedModel):
         return f"{self.year}"
 
 
+# a running import whose worker has not sent a heartbeat for this long is presumed to have died
+RSM_IMPORT_STALE_AFTER = datetime.timedelta(minutes=10)
+
+
+class RSMFileQuerySet(models.QuerySet):
+    def queue(self, stale_before: Optional[datetime.datetime] = None) -> int:
+        """put these files on the import queue, the run_rsm_imports worker picks them up in the order queued.
+        A failed or stale import resumes from its checkpoint, any other starts from the beginning of the file.
+        Files that are being imported are left alone, returns the number queued
+        """
+        now = timezone.now()
+        stale_before = stale_before or now - RSM_IMPORT_STALE_AFTER
+        resume = models.Q(status=RSMFile.Status.FAILED) | models.Q(status=RSMFile.Status.RUNNING)
+        return self.exclude(status=RSMFile.Status.RUNNING, heartbeat_at__gte=stale_before).update(
+            status=RSMFile.Status.QUEUED,
+            queued_at=now,
+            modified_at=now,
+            attempts=0,
+            checkpoint_offset=models.Case(models.When(resume, then="checkpoint_offset"), default=0),
+            rows_processed=models.Case(models.When(resume, then="rows_processed"), default=0),
+            import_counts=models.Case(models.When(resume, then="import_counts"), default=Value({}, models.JSONField())),
+            error=None,
+        )
+
+    @staticmethod
+    def waiting(stale_before: datetime.datetime) -> models.Q:
+        """queued imports, and running ones whose worker has stopped sending heartbeats"""
+        return models.Q(status=RSMFile.Status.QUEUED) | models.Q(
+            status=RSMFile.Status.RUNNING, heartbeat_at__lt=stale_before
+        )
+
+    def claimable(self, stale_before: datetime.datetime, max_attempts: int) -> "RSMFileQuerySet":
+        return self.filter(self.waiting(stale_before), attempts__lt=max_attempts)
+
+    def give_up(self, stale_before: datetime.datetime, max_attempts: int) -> int:
+        """mark waiting imports that have used up their attempts as failed, rather than leave them
+        queued or running for good, returns the number given up on
+        """
+        now = timezone.now()
+        return self.filter(self.waiting(stale_before), attempts__gte=max_attempts).update(
+            status=RSMFile.Status.FAILED,
+            finished_at=now,
+            modified_at=now,
+            error=f"gave up after {max_attempts} attempts, the worker stopped during each of them",
+        )
+
+    def claim_next(self, stale_before: datetime.datetime, max_attempts: int) -> Optional["RSMFile"]:
+        """mark the oldest claimable import as running and return it, rows locked by another worker are skipped"""
+        self.give_up(stale_before, max_attempts)
+        with transaction.atomic():
+            rsm_file = (
+                self.claimable(stale_before, max_attempts)
+                .select_for_update(skip_locked=True)
+                .order_by("queued_at")
+                .first()
+            )
+            if rsm_file:
+                rsm_file.status = RSMFile.Status.RUNNING
+                rsm_file.started_at = rsm_file.heartbeat_at = timezone.now()
+                rsm_file.attempts += 1
+                rsm_file.error = None
+                rsm_file.save(
+                    update_fields=["status", "started_at", "heartbeat_at", "attempts", "error", "modified_at"]
+                )
+        return rsm_file
+
+
 class RSMFile(TimeStampedModel):
-    """raw RSM data files"""
+    """raw RSM data files, each is also a job on the import queue"""
+
+    objects = RSMFileQuerySet.as_manager()
+
+    class Status(models.TextChoices):
+        UPLOADED = "uploaded", "Uploaded"
+        QUEUED = "queued", "Queued"
+        RUNNING = "running", "Running"
+        SUCCEEDED = "succeeded", "Succeeded"
+        FAILED = "failed", "Failed"
 
     csv = models.FileField(upload_to="rsm_csv_files/")
     last_successfully_loaded_at = models.DateTimeField(null=True, blank=True)
+
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.UPLOADED)
+    queued_at = models.DateTimeField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(
+        null=True, blank=True, help_text="written by the worker after every chunk, a stale heartbeat means it died"
+    )
+    finished_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    rows_processed = models.PositiveIntegerField(default=0, help_text="rows of the file committed so far")
+    checkpoint_offset = models.PositiveBigIntegerField(
+        default=0, help_text="byte offset in the file just past the last committed row, a retry resumes here"
+    )
+    import_counts: "models.JSONField[dict[str, int]]" = models.JSONField(
+        default=dict, blank=True, help_text="evaluations created, updated, etc."
+    )
+    error = models.TextField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "queued_at"], name="rsm_file_status_queued_idx")]
+
+    def __str__(self):
+        return self.csv.name
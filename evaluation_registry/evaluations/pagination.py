@@ -0,0 +1,83 @@
+import base64
+import datetime
+import json
+import uuid
+from typing import Optional
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import F, FloatField, Q, QuerySet
+from django.db.models.functions import Cast
+from django.utils.functional import cached_property
+
+
+def encode_cursor(key, pk: uuid.UUID) -> str:
+    """opaque, url-safe, token for the last row of a page"""
+    if isinstance(key, datetime.datetime):
+        key = key.isoformat()
+    return base64.urlsafe_b64encode(json.dumps([key, str(pk)]).encode()).decode()
+
+
+def decode_cursor(cursor: str, rank_ordered: bool) -> tuple:
+    """inverse of encode_cursor, raises ValueError for a malformed cursor"""
+    try:
+        key, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if rank_ordered:
+            return float(key), uuid.UUID(pk)
+        return datetime.datetime.fromisoformat(key), uuid.UUID(pk)
+    except (TypeError, AttributeError) as e:
+        raise ValueError(f"invalid cursor: {cursor}") from e
+
+
+def keyset_paginate(
+    evaluations: QuerySet, cursor: Optional[str], rank_ordered: bool, page_size: int
+) -> tuple[list, Optional[str]]:
+    """seek-pagination, so that fetching any page costs the same as fetching the first.
+
+    Ranked searches are ordered by (rank, id), otherwise by (modified_at, id), both descending.
+    Returns the page of evaluations and the cursor for the next page, if there is one.
+    """
+    if rank_ordered:
+        # ts_rank returns a float4, cast so that the cursor value round-trips exactly
+        evaluations = evaluations.annotate(keyset_key=Cast("rank", output_field=FloatField()))
+    else:
+        evaluations = evaluations.annotate(keyset_key=F("modified_at"))
+    evaluations = evaluations.order_by("-keyset_key", "-id")
+
+    if cursor:
+        key, pk = decode_cursor(cursor, rank_ordered)
+        evaluations = evaluations.filter(Q(keyset_key__lt=key) | Q(keyset_key=key, id__lt=pk))
+
+    page = list(evaluations[: page_size + 1])
+    if len(page) <= page_size:
+        return page, None
+
+    page = page[:page_size]
+    return page, encode_cursor(page[-1].keyset_key, page[-1].id)
+
+
+def estimated_row_count(queryset: QuerySet) -> int:
+    """the planner's row estimate for the whole table, -1 if it has never been analysed"""
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [queryset.model._meta.db_table]
+        )
+        row = cursor.fetchone()
+    return row[0] if row else -1
+
+
+class EstimatedCountPaginator(Paginator):
+    """counting every row of a large table is a sequential scan, so when nothing is filtered
+    and the table is big enough for that to matter the planner's estimate is used instead
+    """
+
+    exact_count_threshold = 10_000
+
+    # Paginator.count is a cached_property as well, but the stubs declare it as a plain property
+    @cached_property
+    def count(self) -> int:  # type: ignore[override]
+        if isinstance(self.object_list, QuerySet) and not self.object_list.query.where:
+            estimate = estimated_row_count(self.object_list)
+            if estimate > self.exact_count_threshold:
+                return estimate
+        return super().count
@@ -0,0 +1,142 @@
+"""cached reference data: departments, evaluation-design-types and taxonomies.
+
+This data only changes through migrations and the admin, so it is held in the
+default cache and invalidated by bumping a version whenever one of these models
+is saved or deleted, or migrations are run.
+"""
+import time
+import uuid
+from types import MappingProxyType
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_migrate, post_save
+
+from evaluation_registry.evaluations.models import (
+    AbstractChoice,
+    Department,
+    EvaluationDesignType,
+    Taxonomy,
+)
+
+REFERENCE_DATA_VERSION_KEY = "reference-data:version"
+
+REFERENCE_QUERYSETS = {
+    "departments": lambda: Department.objects.all(),
+    "design_types": lambda: EvaluationDesignType.objects.all(),
+    "root_design_types": lambda: EvaluationDesignType.root_objects.all(),
+    "taxonomies": lambda: Taxonomy.objects.all(),
+}
+
+
+def get_reference_data_version() -> int:
+    version = cache.get(REFERENCE_DATA_VERSION_KEY)
+    if version is None:
+        cache.add(REFERENCE_DATA_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(REFERENCE_DATA_VERSION_KEY)
+    return version
+
+
+def invalidate_reference_data(**kwargs):
+    """a new version orphans every cached list, these then expire in their own time"""
+    cache.set(REFERENCE_DATA_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def get_reference_data(name: str) -> list:
+    key = f"reference-data:{get_reference_data_version()}:{name}"
+    objects = cache.get(key)
+    if objects is None:
+        objects = list(REFERENCE_QUERYSETS[name]())
+        cache.set(key, objects, settings.REFERENCE_DATA_CACHE_TIMEOUT)
+    return objects
+
+
+def get_departments() -> list[Department]:
+    return get_reference_data("departments")
+
+
+def get_design_types() -> list[EvaluationDesignType]:
+    return get_reference_data("design_types")
+
+
+def get_root_design_types() -> list[EvaluationDesignType]:
+    return get_reference_data("root_design_types")
+
+
+def get_taxonomies() -> list[Taxonomy]:
+    return get_reference_data("taxonomies")
+
+
+class ChoiceTree:
+    """immutable index over a self-referential AbstractChoice model, all lookups are by code
+    and precomputed so that none of them touch the database
+    """
+
+    def __init__(self, choices: Iterable[AbstractChoice]):
+        choices = tuple(choices)
+        by_id: dict[Optional[uuid.UUID], AbstractChoice] = {choice.id: choice for choice in choices}
+        parents = {choice.code: by_id.get(choice.parent_id) for choice in choices}
+
+        children: dict[str, list[AbstractChoice]] = {choice.code: [] for choice in choices}
+        ancestors: dict[str, list[AbstractChoice]] = {choice.code: [] for choice in choices}
+        descendants: dict[str, list[AbstractChoice]] = {choice.code: [] for choice in choices}
+        for choice in choices:
+            if parent := parents[choice.code]:
+                children[parent.code].append(choice)
+            while parent and parent not in ancestors[choice.code]:
+                ancestors[choice.code].append(parent)
+                descendants[parent.code].append(choice)
+                parent = parents[parent.code]
+
+        self._choices = MappingProxyType({choice.code: choice for choice in choices})
+        self._parents = MappingProxyType(parents)
+        self._children = MappingProxyType({code: tuple(c) for code, c in children.items()})
+        self._ancestors = MappingProxyType({code: tuple(a) for code, a in ancestors.items()})
+        self._descendants = MappingProxyType({code: tuple(d) for code, d in descendants.items()})
+        self.roots = tuple(choice for choice in choices if choice.parent_id is None)
+
+    def __contains__(self, code: str) -> bool:
+        return code in self._choices
+
+    def __len__(self) -> int:
+        return len(self._choices)
+
+    def get(self, code: str) -> Optional[AbstractChoice]:
+        return self._choices.get(code)
+
+    def parent(self, code: str) -> Optional[AbstractChoice]:
+        return self._parents.get(code)
+
+    def children(self, code: str) -> tuple[AbstractChoice, ...]:
+        return self._children.get(code, ())
+
+    def ancestors(self, code: str) -> tuple[AbstractChoice, ...]:
+        """nearest first"""
+        return self._ancestors.get(code, ())
+
+    def descendants(self, code: str) -> tuple[AbstractChoice, ...]:
+        return self._descendants.get(code, ())
+
+
+CHOICE_TREE_SOURCES = {EvaluationDesignType: "design_types", Taxonomy: "taxonomies"}
+
+# in-process trees, keyed by reference-data name, each with the version it was built from
+_choice_trees: dict[str, tuple[int, ChoiceTree]] = {}
+
+
+def get_choice_tree(model: type[AbstractChoice]) -> ChoiceTree:
+    name = CHOICE_TREE_SOURCES[model]
+    version = get_reference_data_version()
+    built_version, tree = _choice_trees.get(name, (None, None))
+    if tree is None or built_version != version:
+        tree = ChoiceTree(get_reference_data(name))
+        _choice_trees[name] = (version, tree)
+    return tree
+
+
+for model in Department, EvaluationDesignType, Taxonomy:
+    post_save.connect(invalidate_reference_data, sender=model, dispatch_uid=f"reference-data-save-{model.__name__}")
+    post_delete.connect(invalidate_reference_data, sender=model, dispatch_uid=f"reference-data-delete-{model.__name__}")
+
+post_migrate.connect(invalidate_reference_data, dispatch_uid="reference-data-migrate")
@@ -1,17 +1,19 @@
+from types import MappingProxyType
+from typing import Any, Callable, Container, Mapping, NamedTuple
+
 from django.contrib.auth.decorators import login_required
-from django.http import Http404
+from django.db import transaction
+from django.http import Http404, HttpResponse
 from django.shortcuts import redirect, render
+from django.utils.functional import SimpleLazyObject
 from django.views.decorators.http import require_http_methods
 
 from evaluation_registry.evaluations.forms import (
     EvaluationBasicDetailsForm,
     EvaluationVisibilityForm,
 )
-from evaluation_registry.evaluations.models import (
-    Department,
-    Evaluation,
-    EvaluationDepartmentAssociation,
-)
+from evaluation_registry.evaluations.models import Evaluation
+from evaluation_registry.evaluations.reference_data import get_departments
 from evaluation_registry.evaluations.views import (
     check_evaluation_and_user,
     evaluation_cost_view,
@@ -20,6 +22,7 @@ from evaluation_registry.evaluations.views import (
     evaluation_links_view,
     evaluation_policies_view,
     evaluation_type_view,
+    update_evaluation_departments,
 )
 
 
@@ -45,7 +48,7 @@ def choose_evaluation_status_view(request):
 @login_required
 def evaluation_create_view(request, status):
     errors = {}
-    departments = Department.objects.all()
+    departments = get_departments()
     if request.method == "POST":
         form = EvaluationBasicDetailsForm(request.POST)
 
@@ -56,18 +59,13 @@ def evaluation_create_view(request, status):
 
         if form_complete:
             if form.is_valid():
-                new_evaluation = form.save()
-                new_evaluation.created_by = request.user
-                new_evaluation.save()
-                EvaluationDepartmentAssociation.objects.create(
-                    evaluation=new_evaluation, department=form.cleaned_data["lead_department"], is_lead=True
-                )
-                if form.cleaned_data["departments"]:
-                    for department in form.cleaned_data["departments"]:
-                        EvaluationDepartmentAssociation.objects.create(
-                            evaluation=new_evaluation,
-                            department=department,
-                        )
+                with transaction.atomic():
+                    new_evaluation = form.save(commit=False)
+                    new_evaluation.created_by = request.user
+                    new_evaluation.save()
+                    update_evaluation_departments(
+                        new_evaluation, form.cleaned_data["lead_department"], form.cleaned_data["departments"]
+                    )
 
                 return redirect("share", uuid=new_evaluation.id, page_number=1)
             errors = form.errors.as_data()
@@ -78,7 +76,7 @@ def evaluation_create_view(request, status):
         data = {
             "title": request.POST.get("title"),
             "lead_department": selected_lead,
-            "departments": Department.objects.filter(code__in=selected_departments),
+            "departments": [d for d in departments if d.code in selected_departments],
         }
 
     else:
@@ -146,113 +144,55 @@ def create_view(request, page_number=1, status=None):
     raise Http404("No page number %(verbose_name)s found" % {"verbose_name": page_number})
 
 
+def has_design_type(code: str) -> Callable[[Evaluation, Container[str]], bool]:
+    def condition(evaluation: Evaluation, design_type_codes: Container[str]) -> bool:
+        return code in design_type_codes
+
+    return condition
+
+
+def always(evaluation: Evaluation, design_type_codes: Container[str]) -> bool:
+    return True
+
+
+class ShareStep(NamedTuple):
+    view: Callable[..., HttpResponse]
+    condition: Callable[[Evaluation, Container[str]], bool] = always
+    kwargs: Mapping[str, Any] = MappingProxyType({})
+
+
+SHARE_STEPS = (
+    ShareStep(evaluation_type_view, kwargs={"parent": None}),
+    *(
+        ShareStep(evaluation_type_view, has_design_type(code), kwargs={"parent": code})
+        for code in ("impact", "rct", "quasi_experimental", "theory", "generic", "process", "economic")
+    ),
+    ShareStep(evaluation_description_view),
+    ShareStep(evaluation_policies_view),
+    ShareStep(evaluation_dates_view),
+    ShareStep(evaluation_links_view, lambda evaluation, _: evaluation.status == Evaluation.Status.COMPLETE),
+    ShareStep(evaluation_cost_view, lambda evaluation, _: evaluation.is_final_report_published is True),
+    ShareStep(share_user_confirmation_view),
+    ShareStep(share_confirmation_view),
+)
+
+
 @require_http_methods(["GET", "POST"])
 @login_required
 def share_view(request, uuid, page_number):
     evaluation = check_evaluation_and_user(request, uuid)
 
-    view_options = [
-        {
-            "view": evaluation_type_view,
-            "kwargs": {
-                "parent": None,
-            },
-            "condition": True,
-        },
-        {
-            "view": evaluation_type_view,
-            "kwargs": {
-                "parent": "impact",
-            },
-            "condition": evaluation.evaluation_design_types.filter(code="impact").exists(),
-        },
-        {
-            "view": evaluation_type_view,
-            "kwargs": {
-                "parent": "rct",
-            },
-            "condition": evaluation.evaluation_design_types.filter(code="rct").exists(),
-        },
-        {
-            "view": evaluation_type_view,
-            "kwargs": {
-                "parent": "quasi_experimental",
-            },
-            "condition": evaluation.evaluation_design_types.filter(code="quasi_experimental").exists(),
-        },
-        {
-            "view": evaluation_type_view,
-            "kwargs": {
-                "parent": "theory",
-            },
-            "condition": evaluation.evaluation_design_types.filter(code="theory").exists(),
-        },
-        {
-            "view": evaluation_type_view,
-            "kwargs": {
-                "parent": "generic",
-            },
-            "condition": evaluation.evaluation_design_types.filter(code="generic").exists(),
-        },
-        {
-            "view": evaluation_type_view,
-            "kwargs": {
-                "parent": "process",
-            },
-            "condition": evaluation.evaluation_design_types.filter(code="process").exists(),
-        },
-        {
-            "view": evaluation_type_view,
-            "kwargs": {
-                "parent": "economic",
-            },
-            "condition": evaluation.evaluation_design_types.filter(code="economic").exists(),
-        },
-        {
-            "view": evaluation_description_view,
-            "kwargs": {},
-            "condition": True,
-        },
-        {
-            "view": evaluation_policies_view,
-            "kwargs": {},
-            "condition": True,
-        },
-        {
-            "view": evaluation_dates_view,
-            "kwargs": {},
-            "condition": True,
-        },
-        {
-            "view": evaluation_links_view,
-            "kwargs": {},
-            "condition": evaluation.status == Evaluation.Status.COMPLETE,
-        },
-        {
-            "view": evaluation_cost_view,
-            "kwargs": {},
-            "condition": evaluation.is_final_report_published is True,
-        },
-        {
-            "view": share_user_confirmation_view,
-            "kwargs": {},
-            "condition": True,
-        },
-        {
-            "view": share_confirmation_view,
-            "kwargs": {},
-            "condition": True,
-        },
-    ]
-
-    if (page_number) > len(view_options):
+    if page_number > len(SHARE_STEPS):
         raise Http404("No page number %(verbose_name)s found" % {"verbose_name": page_number})
 
-    for i in range(page_number - 1, len(view_options)):
-        view = view_options[i]
-        view["kwargs"]["next_page"] = i + 2
+    # fetched once, and only if a design-type step is reached
+    design_type_codes = SimpleLazyObject(
+        lambda: frozenset(evaluation.evaluation_design_types.values_list("code", flat=True))
+    )
 
-        if view["condition"]:
-            return view["view"](request, evaluation, **view["kwargs"])
+    for i in range(page_number - 1, len(SHARE_STEPS)):
+        step = SHARE_STEPS[i]
+        if step.condition(evaluation, design_type_codes):
+            return step.view(request, evaluation, next_page=i + 2, **step.kwargs)
 
     return redirect("evaluation-detail", uuid=evaluation.id)
@@ -1,27 +1,44 @@
+import hashlib
+import json
+import operator
+from functools import reduce
+from typing import Optional
+
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.contrib.postgres.search import (
-    SearchQuery,
-    SearchRank,
-    SearchVector,
-)
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
-from django.core.paginator import InvalidPage, Paginator
-from django.db.models import QuerySet
-from django.forms import modelform_factory, modelformset_factory
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import (
+    CharField,
+    Count,
+    Exists,
+    F,
+    Func,
+    OuterRef,
+    Prefetch,
+    Q,
+    QuerySet,
+    Value,
+)
 from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.views.decorators.http import require_http_methods
 
 from evaluation_registry.evaluations.forms import (
+    EVENT_DATE_FORMSETS,
     EvaluationBasicDetailsForm,
+    EvaluationCostForm,
+    EvaluationDescriptionForm,
     EvaluationDesignTypeDetailForm,
+    EvaluationPoliciesForm,
     EvaluationShareForm,
-    EventDateForm,
 )
 from evaluation_registry.evaluations.models import (
-    Department,
+    AbstractChoice,
     Evaluation,
     EvaluationDepartmentAssociation,
     EvaluationDesignType,
@@ -30,6 +47,14 @@ from evaluation_registry.evaluations.models import (
     Taxonomy,
     User,
 )
+from evaluation_registry.evaluations.pagination import keyset_paginate
+from evaluation_registry.evaluations.reference_data import (
+    get_departments,
+    get_root_design_types,
+    get_taxonomies,
+)
+
+SEARCH_PAGE_SIZE = 25
 
 
 def check_evaluation_and_user(request, uuid):
@@ -70,36 +95,142 @@ def authorised_base_evaluation_queryset(show_public: bool, show_user: bool, user
 
 
 def full_text_search(base_queryset: QuerySet, search_term: str) -> QuerySet:
-    """search title and brief-description using PG full-text-search"""
+    """search title and brief-description using PG full-text-search against the
+    stored, GIN-indexed, search-vector
+    """
     if not search_term:
         return base_queryset
 
-    search_title = SearchVector("title", weight="A")
-    description_search = SearchVector("brief_description", weight="B")
-    search_vector = search_title + description_search
     search_query = SearchQuery(search_term)
     evaluation_list = (
-        base_queryset.annotate(
-            search=search_vector,
-            rank=SearchRank(search_vector, search_query),
-        )
-        .filter(search=search_query)
+        base_queryset.filter(search_vector=search_query)
+        .annotate(rank=SearchRank(F("search_vector"), search_query))
         .order_by("-rank")
     )
 
     return evaluation_list
 
 
-def filter_by_department_and_types(evaluations: QuerySet, departments: list[str], types: list[str]) -> QuerySet:
-    """filter query set on department-codes and evaluation-types"""
+def prefetch_search_results(evaluations: QuerySet) -> QuerySet:
+    """preload the departments and root design-types shown for each search result"""
+    return evaluations.prefetch_related(
+        "departments",
+        Prefetch(
+            "evaluation_design_types",
+            queryset=EvaluationDesignType.objects.filter(parent__isnull=True),
+            to_attr="root_design_types",
+        ),
+    )
+
+
+def subtree_filter(model: type[AbstractChoice], field: str, codes: list[str]) -> Optional[Q]:
+    """match the choices with these codes and everything beneath them, as prefix matches on the
+    indexed materialised path, or None if none of the codes exist
+    """
+    tree = model.objects.tree()
+    choices = [tree.get(code) for code in codes if code in tree]
+    if not choices:
+        return None
+    # an empty path, from a write that bypassed save, would prefix-match every row, so only the choice itself matches
+    return reduce(
+        operator.or_,
+        (
+            Q(**{f"{field}__path__startswith": choice.path}) if choice.path else Q(**{f"{field}__code": choice.code})
+            for choice in choices
+        ),
+    )
+
+
+def filter_by_department_and_types(
+    evaluations: QuerySet, departments: list[str], types: list[str], policies: Optional[list[str]] = None
+) -> QuerySet:
+    """filter query set on department-codes, evaluation-types and policy-areas,
+    types and policies also match any of their children
+
+    semi-joins (EXISTS) are used rather than joining through the many-to-many tables,
+    so rows are never duplicated and no DISTINCT is required
+    """
 
     if departments:
-        evaluations = evaluations.filter(departments__code__in=departments)
+        evaluations = evaluations.filter(
+            Exists(
+                EvaluationDepartmentAssociation.objects.filter(
+                    evaluation=OuterRef("pk"), department__code__in=departments
+                )
+            )
+        )
 
     if types:
-        evaluations = evaluations.filter(evaluation_design_types__code__in=types)
+        design_type_filter = subtree_filter(EvaluationDesignType, "design_type", types)
+        if design_type_filter is None:
+            return evaluations.none()
+        evaluations = evaluations.filter(
+            Exists(EvaluationDesignTypeDetail.objects.filter(design_type_filter, evaluation=OuterRef("pk")))
+        )
 
-    return evaluations.distinct()
+    if policies:
+        policy_filter = subtree_filter(Taxonomy, "taxonomy", policies)
+        if policy_filter is None:
+            return evaluations.none()
+        evaluations = evaluations.filter(
+            Exists(Evaluation.policies.through.objects.filter(policy_filter, evaluation=OuterRef("pk")))
+        )
+
+    return evaluations
+
+
+def root_code(path_field: str) -> Func:
+    """the root code is the first segment of a materialised path"""
+    return Func(F(path_field), Value("/"), Value(1), function="split_part", output_field=CharField())
+
+
+def count_facets(
+    evaluations: QuerySet, departments: list[str], types: list[str], policies: Optional[list[str]] = None
+) -> dict[str, dict[str, int]]:
+    """number of evaluations per department-code, per root evaluation-type-code and per root
+    policy-area-code, in a single query. Types and policy-areas include evaluations of any child.
+
+    Each facet is counted with the other facets' filters applied but not its own,
+    so the counts for unselected options are not all zero once an option is chosen.
+    """
+    department_counts = (
+        EvaluationDepartmentAssociation.objects.filter(
+            evaluation__in=filter_by_department_and_types(evaluations, [], types, policies).values("pk")
+        )
+        .values(facet=Value("departments", output_field=CharField()), code=F("department__code"))
+        .annotate(count=Count("evaluation"))
+    )
+    type_counts = (
+        EvaluationDesignTypeDetail.objects.filter(
+            evaluation__in=filter_by_department_and_types(evaluations, departments, [], policies).values("pk"),
+        )
+        .values(facet=Value("evaluation_types", output_field=CharField()), code=root_code("design_type__path"))
+        .annotate(count=Count("evaluation", distinct=True))
+    )
+    policy_counts = (
+        Evaluation.policies.through.objects.filter(
+            evaluation__in=filter_by_department_and_types(evaluations, departments, types, []).values("pk"),
+        )
+        .values(facet=Value("policies", output_field=CharField()), code=root_code("taxonomy__path"))
+        .annotate(count=Count("evaluation", distinct=True))
+    )
+
+    counts: dict[str, dict[str, int]] = {"departments": {}, "evaluation_types": {}, "policies": {}}
+    for row in department_counts.union(type_counts, policy_counts, all=True):
+        counts[row["facet"]][row["code"]] = row["count"]
+    return counts
+
+
+def search_cache_key(prefix: str, user: User, **search_parameters) -> str:
+    """cache key for a normalised search, results are per-user when the user's own evaluations are shown"""
+    normalised = {
+        key: sorted(set(value)) if isinstance(value, list) else (value or "").strip().lower()
+        for key, value in search_parameters.items()
+    }
+    if "user" in normalised.get("evaluations_to_show", []):
+        normalised["user"] = str(user.pk)
+    digest = hashlib.sha256(json.dumps(normalised, sort_keys=True).encode()).hexdigest()
+    return f"{prefix}:{digest}"
 
 
 @require_http_methods(["GET"])
@@ -108,6 +239,7 @@ def evaluation_list_view(request):
     search_term = request.GET.get("search_term")
     selected_departments = request.GET.getlist("departments")
     selected_types = request.GET.getlist("evaluation_types")
+    selected_policies = request.GET.getlist("policies")
     evaluations_to_show = request.GET.getlist("evaluations_to_show")
 
     if request.user.is_authenticated:
@@ -117,39 +249,71 @@ def evaluation_list_view(request):
     else:
         base_evaluation_queryset = Evaluation.objects.filter(visibility=Evaluation.Visibility.PUBLIC)
 
+    searched_evaluations = full_text_search(base_evaluation_queryset, search_term)
     evaluation_list = filter_by_department_and_types(
-        full_text_search(base_evaluation_queryset, search_term),
-        selected_departments,
-        selected_types,
+        searched_evaluations, selected_departments, selected_types, selected_policies
+    )
+
+    facet_cache_key = search_cache_key(
+        "search-facets",
+        request.user,
+        search_term=search_term,
+        departments=selected_departments,
+        evaluation_types=selected_types,
+        policies=selected_policies,
+        evaluations_to_show=evaluations_to_show,
     )
+    facet_counts = cache.get(facet_cache_key)
+    if facet_counts is None:
+        facet_counts = count_facets(searched_evaluations, selected_departments, selected_types, selected_policies)
+        cache.set(facet_cache_key, facet_counts, settings.SEARCH_FACET_CACHE_TIMEOUT)
 
+    policies = Taxonomy.objects.tree()
     search_choices = {
-        "departments": Department.objects.filter(code__in=selected_departments).all(),
-        "evaluation_types": [
-            (e.code, e.display) for e in EvaluationDesignType.root_objects.filter(code__in=selected_types)
-        ],
+        "departments": [d for d in get_departments() if d.code in selected_departments],
+        "evaluation_types": [(e.code, e.display) for e in get_root_design_types() if e.code in selected_types],
+        "policies": [(code, str(policies.get(code))) for code in selected_policies if code in policies],
     }
 
-    paginator = Paginator(evaluation_list, 25, allow_empty_first_page=True)
-    page_number = request.GET.get("page") or 1
-    page_obj = paginator.get_page(page_number)
-    try:
-        pages_list = paginator.get_elided_page_range(page_number, on_each_side=1, on_ends=1)
-    except InvalidPage:
-        pages_list = []
+    evaluation_list = prefetch_search_results(evaluation_list)
+
+    if "cursor" in request.GET:
+        # keyset mode, for crawlers and exports walking every page, no count or page-range is computed
+        try:
+            page_obj, next_cursor = keyset_paginate(
+                evaluation_list, request.GET["cursor"], rank_ordered=bool(search_term), page_size=SEARCH_PAGE_SIZE
+            )
+        except ValueError:
+            raise Http404("Invalid cursor")
+        pagination = {"cursor_mode": True, "page_obj": page_obj, "next_cursor": next_cursor}
+    else:
+        # the paginator counts the results once, this count is reused for the page-range and the template
+        paginator = Paginator(evaluation_list, SEARCH_PAGE_SIZE, allow_empty_first_page=True)
+        page_number = request.GET.get("page") or 1
+        page_obj = paginator.get_page(page_number)
+        # the range is built around the page shown, get_page has already clamped an out-of-range number
+        pages_list = paginator.get_elided_page_range(page_obj.number, on_each_side=1, on_ends=1)
+        pagination = {
+            "cursor_mode": False,
+            "page_obj": page_obj,
+            "result_count": paginator.count,
+            "pages_list": pages_list,
+        }
+
     return render(
         request,
         "evaluation_list.html",
         {
-            "evaluations": evaluation_list,
-            "page_obj": page_obj,
-            "pages_list": pages_list,
+            **pagination,
             "search_term": search_term if search_term else "",
-            "departments": Department.objects.all(),
-            "evaluation_types": EvaluationDesignType.root_objects.all(),
+            "departments": get_departments(),
+            "evaluation_types": get_root_design_types(),
+            "policies": policies.roots,
             "selected_departments": selected_departments,
             "selected_types": selected_types,
+            "selected_policies": selected_policies,
             "search_choices": search_choices,
+            "facet_counts": facet_counts,
             "is_authenticated": request.user.is_authenticated,
             "evaluations_to_show": evaluations_to_show,
         },
@@ -158,7 +322,7 @@ def evaluation_list_view(request):
 
 @require_http_methods(["GET"])
 def evaluation_detail_view(request, uuid):
-    evaluation = get_object_or_404(Evaluation, id=uuid)
+    evaluation = get_object_or_404(Evaluation.objects.with_detail(), id=uuid)
 
     user_can_edit = evaluation.created_by == request.user
 
@@ -168,55 +332,92 @@ def evaluation_detail_view(request, uuid):
     )
 
 
+def update_evaluation_departments(evaluation, lead_department, departments):
+    """make the evaluation's department associations match those submitted, in a fixed number of queries"""
+    wanted = {department.id: False for department in departments}
+    wanted[lead_department.id] = True
+
+    associations = EvaluationDepartmentAssociation.objects.filter(evaluation=evaluation)
+    existing = dict(associations.values_list("department_id", "is_lead"))
+
+    associations.exclude(department_id__in=wanted).delete()
+
+    # demote before promoting, as there can only be one lead at a time
+    demoted = [
+        department_id for department_id, is_lead in existing.items() if is_lead and wanted.get(department_id) is False
+    ]
+    if demoted:
+        associations.filter(department_id__in=demoted).update(is_lead=False)
+    if existing.get(lead_department.id) is False:
+        associations.filter(department_id=lead_department.id).update(is_lead=True)
+
+    EvaluationDepartmentAssociation.objects.bulk_create(
+        EvaluationDepartmentAssociation(evaluation=evaluation, department_id=department_id, is_lead=is_lead)
+        for department_id, is_lead in wanted.items()
+        if department_id not in existing
+    )
+
+    if existing.get(lead_department.id) is not True:  # bulk writes bypass the lead-department signals
+        Evaluation.objects.filter(pk=evaluation.pk).update_lead_department()
+        evaluation.lead_department = lead_department
+
+
 def update_evaluation_design_objects(existing_objects, existing_design_types, form):
-    should_update_text = "text" in form.changed_data
+    """apply the submitted design types as one diff: a bulk delete, a bulk insert and a text update"""
+    text = form.cleaned_data.get("text")
     to_add = set(form.cleaned_data["design_types"]).difference(existing_design_types)
-    for design_type in to_add:
-        EvaluationDesignTypeDetail.objects.create(
-            evaluation=form.cleaned_data["evaluation"],
-            design_type=design_type,
-            text=form.cleaned_data["text"] if design_type.collect_description else None,
-        )
-        if design_type.collect_description:
-            should_update_text = False  # text has been updated by creating this new object
-
     to_remove = set(existing_design_types).difference(form.cleaned_data["design_types"])
-    for design_type in to_remove:
-        existing_objects.filter(design_type=design_type).delete()
 
-    if should_update_text:  # handles the case where the 'Other' text has been updated
-        existing_objects.filter(design_type__collect_description=True).update(text=form.cleaned_data["text"])
+    with transaction.atomic():
+        if to_remove:
+            existing_objects.filter(design_type__in=to_remove).delete()
+
+        EvaluationDesignTypeDetail.objects.bulk_create(
+            EvaluationDesignTypeDetail(
+                evaluation=form.cleaned_data["evaluation"],
+                design_type=design_type,
+                text=text if design_type.collect_description else None,
+            )
+            for design_type in to_add
+        )
+
+        # handles the case where the 'Other' text has been updated, unless it was just created with it
+        if "text" in form.changed_data and not any(design_type.collect_description for design_type in to_add):
+            existing_objects.filter(design_type__collect_description=True).update(text=text)
 
 
 def evaluation_type_view(request, evaluation, parent=None, next_page=None):
     if parent:
-        parent_object = EvaluationDesignType.objects.get(code=parent)
-        options = EvaluationDesignType.objects.filter(parent__code=parent)
-        if not options.exists():
+        design_types = EvaluationDesignType.objects.tree()
+        parent_object = design_types.get(parent)
+        options = design_types.children(parent)
+        if not options:
             raise Http404(
                 "No %(verbose_name)s found matching the query"
                 % {"verbose_name": EvaluationDesignType._meta.verbose_name}
             )
     else:
-        options = EvaluationDesignType.root_objects.all()
+        options = get_root_design_types()
         parent_object = None
     options = list(options)
     if any(option.display.lower() == "other" for option in options):
         other_option = next(option for option in options if option.display.lower() == "other")
         options.append(options.pop(options.index(other_option)))
     data = {"evaluation": evaluation, "design_types": [], "design_types_codes": [], "text": ""}
-    existing_links = EvaluationDesignTypeDetail.objects.filter(evaluation=evaluation, design_type__in=options)
+    options_by_id = {option.id: option for option in options}
+    existing_links = EvaluationDesignTypeDetail.objects.filter(evaluation=evaluation, design_type_id__in=options_by_id)
 
     for existing_link in existing_links:
-        data["design_types"].append(existing_link.design_type)
-        data["design_types_codes"].append(existing_link.design_type.code)
-        if existing_link.design_type.collect_description and existing_link.text:
+        design_type = options_by_id[existing_link.design_type_id]  # already held, so not lazy-loaded per link
+        data["design_types"].append(design_type)
+        data["design_types_codes"].append(design_type.code)
+        if design_type.collect_description and existing_link.text:
             data["text"] = existing_link.text
 
     errors = {}
 
     if request.method == "POST":
-        form = EvaluationDesignTypeDetailForm(request.POST, initial=data)
+        form = EvaluationDesignTypeDetailForm(request.POST, initial=data, evaluation=evaluation)
 
         if not parent and not form["design_types"].value():
             form.add_error("design_types", "Please select at least one evaluation type")
@@ -266,17 +467,10 @@ def evaluation_update_type_view(request, uuid, parent=None):
 
 def evaluation_description_view(request, evaluation, next_page=None):
     errors = {}
-    form_fields = [
-        "brief_description",
-        "grant_number",
-        "has_grant_number",
-        "major_project_number",
-        "has_major_project_number",
-    ]
-    EvaluationForm = modelform_factory(Evaluation, fields=form_fields)  # noqa: N806
+    form_fields = EvaluationDescriptionForm._meta.fields
 
     if request.method == "POST":
-        form = EvaluationForm(request.POST, instance=evaluation)
+        form = EvaluationDescriptionForm(request.POST, instance=evaluation)
 
         if form.is_valid():
             for field in form_fields:
@@ -291,7 +485,7 @@ def evaluation_description_view(request, evaluation, next_page=None):
             errors = form.errors.as_data()
 
     else:
-        form = EvaluationForm(instance=evaluation)
+        form = EvaluationDescriptionForm(instance=evaluation)
 
     return render(
         request,
@@ -313,16 +507,12 @@ def evaluation_update_view(request, uuid):
 
 
 def evaluation_dates_view(request, evaluation, next_page=None):
-    form_fields = ["evaluation", "month", "year", "other_description", "category"]
-    existing_date_count = EventDate.objects.filter(evaluation=evaluation).count()
+    # ordered, so that the formset uses these loaded rows as they are rather than re-querying
+    existing_dates = EventDate.objects.filter(evaluation=evaluation).order_by("created_at", "pk")
+    existing_date_count = len(existing_dates)
     other_errors = {}
 
-    DateFormset = modelformset_factory(  # noqa: N806
-        EventDate,
-        form=EventDateForm,
-        fields=form_fields,
-        extra=1 if existing_date_count else 3,
-    )
+    DateFormset = EVENT_DATE_FORMSETS[1 if existing_date_count else 3]  # noqa: N806
 
     initial_formset_data = (
         [
@@ -336,14 +526,17 @@ def evaluation_dates_view(request, evaluation, next_page=None):
 
     if request.method == "POST":
         formset = DateFormset(
-            request.POST, queryset=EventDate.objects.filter(evaluation=evaluation), initial=initial_formset_data
+            request.POST,
+            queryset=existing_dates,
+            initial=initial_formset_data,
+            form_kwargs={"evaluation": evaluation},
         )
 
         for form in formset:
             form.initial["evaluation"] = evaluation  # required so the blank form is ignored if unchanged
 
         if formset.is_valid():
-            formset.save()
+            formset.save_in_bulk()
 
             new_date_requested = request.POST.get("addanother") == "date"
             formset_changed = any(form.has_changed() for form in formset)
@@ -361,7 +554,9 @@ def evaluation_dates_view(request, evaluation, next_page=None):
                 return redirect("evaluation-detail", uuid=evaluation.id)
 
     else:
-        formset = DateFormset(queryset=EventDate.objects.filter(evaluation=evaluation), initial=initial_formset_data)
+        formset = DateFormset(
+            queryset=existing_dates, initial=initial_formset_data, form_kwargs={"evaluation": evaluation}
+        )
 
     return render(
         request,
@@ -443,13 +638,10 @@ def evaluation_update_links_view(request, uuid):
 
 
 def evaluation_policies_view(request, evaluation, next_page=None):
-    EvaluationForm = modelform_factory(Evaluation, fields=["policies"])  # noqa: N806
-    EvaluationForm.base_fields["policies"].to_field_name = "code"
-
     selected_policies = list(map(lambda p: p.code, evaluation.policies.all()))
 
     if request.method == "POST":
-        form = EvaluationForm(request.POST, instance=evaluation)
+        form = EvaluationPoliciesForm(request.POST, instance=evaluation)
 
         if form.is_valid():
             form.save()
@@ -463,7 +655,7 @@ def evaluation_policies_view(request, evaluation, next_page=None):
             selected_policies = request.POST.getlist("selected_policies")
 
     else:
-        form = EvaluationForm(instance=evaluation)
+        form = EvaluationPoliciesForm(instance=evaluation)
         errors = {}
 
     return render(
@@ -473,7 +665,7 @@ def evaluation_policies_view(request, evaluation, next_page=None):
             "evaluation": evaluation,
             "form": form,
             "errors": errors,
-            "policies": Taxonomy.objects.all(),
+            "policies": get_taxonomies(),
             "selected_policies": selected_policies,
         },
     )
@@ -488,10 +680,8 @@ def evaluation_update_policies_view(request, uuid):
 
 
 def evaluation_cost_view(request, evaluation, next_page=None):
-    EvaluationForm = modelform_factory(Evaluation, fields=["cost"])  # noqa: N806
-
     if request.method == "POST":
-        form = EvaluationForm(request.POST, instance=evaluation)
+        form = EvaluationCostForm(request.POST, instance=evaluation)
 
         cost = request.POST.get("cost")
         cost_is_unknown = request.POST.get("cost-unknown")
@@ -513,7 +703,7 @@ def evaluation_cost_view(request, evaluation, next_page=None):
             errors = form.errors.as_data()
 
     else:
-        form = EvaluationForm(instance=evaluation)
+        form = EvaluationCostForm(instance=evaluation)
         errors = {}
 
     return render(
@@ -540,7 +730,7 @@ def evaluation_update_cost_view(request, uuid):
 def evaluation_update_title_department_view(request, uuid):
     evaluation = check_evaluation_and_user(request, uuid)
     errors = {}
-    departments = Department.objects.all()
+    departments = get_departments()
 
     if request.method == "POST":
         form = EvaluationBasicDetailsForm(request.POST, instance=evaluation)
@@ -551,30 +741,11 @@ def evaluation_update_title_department_view(request, uuid):
 
         if form_complete:
             if form.is_valid():
-                form.save()
-
-                if form.cleaned_data["lead_department"] != evaluation.lead_department:
-                    lead_department_link = EvaluationDepartmentAssociation.objects.get(
-                        evaluation=evaluation, is_lead=True
+                with transaction.atomic():
+                    form.save()
+                    update_evaluation_departments(
+                        evaluation, form.cleaned_data["lead_department"], form.cleaned_data["departments"]
                     )
-                    lead_department_link.department = form.cleaned_data["lead_department"]
-                    lead_department_link.save()
-
-                to_add = set(form.cleaned_data["departments"]).difference(evaluation.other_departments) or set()
-
-                for department in to_add:
-                    EvaluationDepartmentAssociation.objects.create(
-                        evaluation=evaluation,
-                        department=department,
-                    )
-
-                # remove unwanted departments
-                EvaluationDepartmentAssociation.objects.filter(
-                    evaluation=evaluation,
-                    department__in=evaluation.other_departments,
-                ).exclude(
-                    department__in=form.cleaned_data["departments"],
-                ).delete()
 
                 return redirect("evaluation-detail", uuid=evaluation.id)
             errors = form.errors.as_data()
@@ -585,7 +756,7 @@ def evaluation_update_title_department_view(request, uuid):
         data = {
             "title": request.POST.get("title"),
             "lead_department": selected_lead,
-            "departments": Department.objects.filter(code__in=selected_departments),
+            "departments": [d for d in departments if d.code in selected_departments],
         }
 
     else:
@@ -31,6 +31,12 @@ def remove_query_param(query_dict, key_to_change, value_to_change):
     return qd.urlencode()
 
 
+def replace_query_param(query_dict, key_to_change, value):
+    qd = query_dict.copy()
+    qd[key_to_change] = value
+    return qd.urlencode()
+
+
 def markdown(text, cls=None):
     """
     Converts the given text into markdown.
@@ -74,6 +80,7 @@ def environment(**options):
             "is_in": is_in,
             "url": url,
             "remove_query_param": remove_query_param,
+            "replace_query_param": replace_query_param,
             "humanize_timedelta": humanize_timedelta,
         }
     )
@@ -110,12 +110,21 @@ if env.str("AWS_STORAGE_BUCKET_NAME", default=None):
     DEFAULT_FILE_STORAGE = "storages.backends.s3boto3.S3Boto3Storage"
     AWS_STORAGE_BUCKET_NAME = env.str("AWS_STORAGE_BUCKET_NAME")
     AWS_S3_REGION_NAME = env.str("AWS_REGION_NAME")
+    # files read from the bucket are spooled to disk beyond this, rather than held in memory whatever their size
+    AWS_S3_MAX_MEMORY_SIZE = env.int("AWS_S3_MAX_MEMORY_SIZE", default=8 * 1024 * 1024)
     INSTALLED_APPS += ["health_check.contrib.s3boto3_storage"]
 else:
     DEFAULT_FILE_STORAGE = "django.core.files.storage.FileSystemStorage"
 
 
 OPENAI_KEY = env.str("OPENAI_KEY", default=None)
+# point this at a local stub server to run the reformatting pipeline without calling OpenAI
+OPENAI_BASE_URL = env.str("OPENAI_BASE_URL", default=None)
+# requests made at once, and per minute, when reformatting evaluation text
+OPENAI_CONCURRENCY = env.int("OPENAI_CONCURRENCY", default=8)
+OPENAI_REQUESTS_PER_MINUTE = env.int("OPENAI_REQUESTS_PER_MINUTE", default=500)
+# retries, with exponential backoff, of rate-limited, failed or timed out requests
+OPENAI_MAX_RETRIES = env.int("OPENAI_MAX_RETRIES", default=5)
 
 
 # Django debug toolbar
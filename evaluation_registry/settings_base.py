@@ -186,3 +186,28 @@ CSP_STYLE_SRC = (
 CSP_FRAME_ANCESTORS = ("'none'",)
 
 DATA_UPLOAD_MAX_MEMORY_SIZE = 100 * 1024 * 1024  # 100 megabytes in bytes
+
+# local-memory by default, point CACHE_BACKEND/CACHE_LOCATION at a shared backend, e.g.
+# django.core.cache.backends.redis.RedisCache, so that all workers share one cache
+CACHES = {
+    "default": {
+        "BACKEND": env.str("CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": env.str("CACHE_LOCATION", default="evaluation-registry"),
+    },
+    # reformatted evaluation text, by a hash of the original, so that no text is sent to OpenAI twice.
+    # This must persist across processes and never cull, so it is a database table by default,
+    # created by `manage.py createcachetable`
+    "reformat": {
+        "BACKEND": env.str("REFORMAT_CACHE_BACKEND", default="django.core.cache.backends.db.DatabaseCache"),
+        "LOCATION": env.str("REFORMAT_CACHE_LOCATION", default="reformatted_text_cache"),
+        "TIMEOUT": None,
+        "OPTIONS": {"MAX_ENTRIES": env.int("REFORMAT_CACHE_MAX_ENTRIES", default=10_000_000)},
+    },
+}
+
+# seconds for which departments, design-types and taxonomies are cached, these are also
+# invalidated on save/delete, but only in the local process when using the local-memory cache
+REFERENCE_DATA_CACHE_TIMEOUT = env.int("REFERENCE_DATA_CACHE_TIMEOUT", default=5 * 60)
+
+# seconds for which per-search facet counts are cached, 0 disables caching
+SEARCH_FACET_CACHE_TIMEOUT = env.int("SEARCH_FACET_CACHE_TIMEOUT", default=60)
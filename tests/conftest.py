@@ -1,5 +1,6 @@
 import pytest
 import pytz
+from django.core.cache import cache
 
 from evaluation_registry.evaluations.models import (
     Department,
@@ -14,6 +15,12 @@ from evaluation_registry.evaluations.models import (
 UTC = pytz.timezone("UTC")
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+
+
 @pytest.fixture
 def create_user():
     def _create_user(email):
@@ -1,17 +1,30 @@
+import datetime
 import os
+from unittest.mock import patch
 
 import pytest
+from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.utils import timezone
 
-from evaluation_registry.evaluations.models import Evaluation, RSMFile
+from evaluation_registry.evaluations.models import (
+    Evaluation,
+    EvaluationDepartmentAssociation,
+    EvaluationDesignTypeDetail,
+    RSMFile,
+)
+from evaluation_registry.evaluations.pagination import EstimatedCountPaginator
 
 
 @pytest.mark.django_db
-def test_rsm_upload(admin_client):
-    """this test is in two parts:
+def test_rsm_upload(admin_client, tmp_path, settings):
+    """this test is in three parts:
     1. upload a new RSM csv
     2. call the import_csv action on it
+    3. run the worker that imports it
     """
+    settings.MEDIA_ROOT = tmp_path
     file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rsm-data-2023-07-21.csv")
 
     with open(file_path, "rb") as file:
@@ -42,9 +55,59 @@ def test_rsm_upload(admin_client):
     )
 
     assert response.status_code == 200
+    file.refresh_from_db()
+    assert file.status == RSMFile.Status.QUEUED
+    assert Evaluation.objects.count() == initial_count
+
+    call_command("run_rsm_imports", "--once")
+
+    file.refresh_from_db()
+    assert file.status == RSMFile.Status.SUCCEEDED
+    assert file.import_counts["created"] == 3
+    assert file.last_successfully_loaded_at
     assert Evaluation.objects.count() - initial_count == 3
 
 
+@pytest.mark.django_db
+def test_import_csv_leaves_running_imports_alone(admin_client, settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    file = RSMFile.objects.create(csv=ContentFile(b"", name="rsm.csv"))
+    RSMFile.objects.filter(pk=file.pk).update(
+        status=RSMFile.Status.RUNNING, heartbeat_at=timezone.now(), attempts=1, checkpoint_offset=100
+    )
+
+    response = admin_client.post(
+        "/admin/evaluations/rsmfile/",
+        {"action": "import_csv", "_selected_action": [file.pk]},
+        follow=True,
+    )
+
+    assert "already being imported" in response.content.decode()
+    file.refresh_from_db()
+    assert (file.status, file.attempts, file.checkpoint_offset) == (RSMFile.Status.RUNNING, 1, 100)
+
+
+@pytest.mark.django_db
+def test_import_csv_requeues_stale_imports(admin_client, settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    file = RSMFile.objects.create(csv=ContentFile(b"", name="rsm.csv"))
+    # its worker died an hour ago, and it has used up its attempts
+    an_hour_ago = timezone.now() - datetime.timedelta(hours=1)
+    RSMFile.objects.filter(pk=file.pk).update(
+        status=RSMFile.Status.RUNNING, heartbeat_at=an_hour_ago, attempts=3, checkpoint_offset=100
+    )
+
+    response = admin_client.post(
+        "/admin/evaluations/rsmfile/",
+        {"action": "import_csv", "_selected_action": [file.pk]},
+        follow=True,
+    )
+
+    assert "has been queued for import" in response.content.decode()
+    file.refresh_from_db()
+    assert (file.status, file.attempts, file.checkpoint_offset) == (RSMFile.Status.QUEUED, 0, 100)
+
+
 @pytest.mark.django_db
 def test_evaluation_admin_performance(impact_evaluation, admin_client, django_assert_max_num_queries):
     with django_assert_max_num_queries(18):
@@ -55,3 +118,31 @@ def test_evaluation_admin_performance(impact_evaluation, admin_client, django_as
 def test_taxonomy_admin_performance(child_policy, admin_client, django_assert_max_num_queries):
     with django_assert_max_num_queries(3):
         admin_client.get(f"/admin/taxonomies/evaluation/{child_policy.pk}/change/")
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("number_of_evaluations", [1, 30])
+def test_evaluation_admin_changelist_performance(
+    admin_client, cabinet_office, impact, number_of_evaluations, django_assert_max_num_queries
+):
+    for i in range(number_of_evaluations):
+        evaluation = Evaluation.objects.create(title=f"evaluation {i}")
+        EvaluationDepartmentAssociation.objects.create(evaluation=evaluation, department=cabinet_office, is_lead=True)
+        EvaluationDesignTypeDetail.objects.create(evaluation=evaluation, design_type=impact)
+
+    with django_assert_max_num_queries(8):
+        response = admin_client.get("/admin/evaluations/evaluation/", {"design_type": "impact"})
+    assert response.status_code == 200
+    assert response.context["cl"].result_count == number_of_evaluations
+    assert str(cabinet_office) in response.content.decode()
+
+
+@pytest.mark.django_db
+def test_estimated_count_paginator(basic_evaluation):
+    paginator = EstimatedCountPaginator(Evaluation.objects.order_by("pk"), 10)
+    assert paginator.count == 1
+
+    with patch("evaluation_registry.evaluations.pagination.estimated_row_count", return_value=1_000_000):
+        assert EstimatedCountPaginator(Evaluation.objects.order_by("pk"), 10).count == 1_000_000
+        # filtered changelists are always counted exactly
+        assert EstimatedCountPaginator(Evaluation.objects.filter(title="nothing"), 10).count == 0
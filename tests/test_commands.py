@@ -1,9 +1,38 @@
+import csv
+import datetime
+import io
+import json
 import os
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import MagicMock, patch
 
 import pytest
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
 from django.core.management import call_command
+from django.utils import timezone
 
-from evaluation_registry.evaluations.models import Evaluation
+from evaluation_registry.evaluations.management.commands import (
+    load_rsm_csv,
+    reformat_description,
+)
+from evaluation_registry.evaluations.management.commands.reformat_description import (
+    TextReformatter,
+    TokenBucket,
+    reformat_cache_key,
+)
+from evaluation_registry.evaluations.management.commands.run_rsm_imports import (
+    MAX_ATTEMPTS,
+)
+from evaluation_registry.evaluations.models import (
+    Evaluation,
+    EvaluationDesignType,
+    Report,
+    RSMFile,
+)
 
 
 @pytest.mark.django_db
@@ -13,3 +42,304 @@ def test_load_rsm_csv():
     call_command("load_rsm_csv", file_path)
     final_evaluation_count = Evaluation.objects.count()
     assert final_evaluation_count - initial_evaluation_count == 3
+
+
+@pytest.mark.django_db
+def test_load_rsm_csv_writes_in_bulk(django_assert_max_num_queries):
+    file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rsm-data-2023-07-21.csv")
+    EvaluationDesignType.objects.tree()
+
+    # one insert per model, whatever the number of rows
+    with django_assert_max_num_queries(20):
+        call_command("load_rsm_csv", file_path)
+
+    evaluations = Evaluation.objects.filter(rsm_evaluation_id__isnull=False)
+    assert sorted(evaluations.values_list("rsm_evaluation_id", flat=True)) == [11, 22, 33]
+    assert Report.objects.filter(evaluation__in=evaluations).count() == 3
+    assert not evaluations.filter(search_vector=None).exists()
+
+
+@pytest.mark.django_db
+def test_load_rsm_csv_reimport_is_incremental(tmp_path, django_assert_max_num_queries):
+    file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rsm-data-2023-07-21.csv")
+    call_command("load_rsm_csv", file_path)
+    loaded = {
+        evaluation.rsm_evaluation_id: evaluation for evaluation in Evaluation.objects.filter(created_by__isnull=False)
+    }
+
+    # an unchanged file writes nothing
+    with django_assert_max_num_queries(8):
+        call_command("load_rsm_csv", file_path)
+
+    with open(file_path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    fieldnames = list(rows[0])
+    rows = [row for row in rows if row["Evaluation ID"] != "33"]
+    for row in rows:
+        if row["Evaluation ID"] == "22":
+            row["Evaluation title"] = "A new title"
+    changed_path = tmp_path / "rsm.csv"
+    with open(changed_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    call_command("load_rsm_csv", str(changed_path))
+
+    evaluations = {evaluation.rsm_evaluation_id: evaluation for evaluation in Evaluation.objects.all()}
+    assert sorted(evaluations) == [11, 22]
+    assert evaluations[11].modified_at == loaded[11].modified_at
+    assert evaluations[22].pk == loaded[22].pk
+    assert evaluations[22].title == "A new title"
+    assert evaluations[22].history.count() == 2
+    assert Report.objects.filter(evaluation=evaluations[22]).count() == 1
+
+
+@pytest.mark.django_db
+def test_run_rsm_imports_records_failure(tmp_path, settings):
+    settings.MEDIA_ROOT = tmp_path
+    rsm_file = RSMFile.objects.create(csv=ContentFile(b"not,an,rsm,file\n1,2,3,4\n", name="broken.csv"))
+    RSMFile.objects.filter(pk=rsm_file.pk).queue()
+
+    call_command("run_rsm_imports", "--once")
+
+    rsm_file.refresh_from_db()
+    assert rsm_file.status == RSMFile.Status.FAILED
+    assert "KeyError" in rsm_file.error
+    assert rsm_file.attempts == 1
+    assert rsm_file.last_successfully_loaded_at is None
+
+
+@pytest.mark.django_db
+def test_run_rsm_imports_reclaims_stale_jobs(tmp_path, settings):
+    settings.MEDIA_ROOT = tmp_path
+    file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rsm-data-2023-07-21.csv")
+    with open(file_path, "rb") as f:
+        rsm_file = RSMFile.objects.create(csv=ContentFile(f.read(), name="rsm.csv"))
+
+    # a worker died an hour into this import
+    an_hour_ago = timezone.now() - datetime.timedelta(hours=1)
+    RSMFile.objects.filter(pk=rsm_file.pk).update(
+        status=RSMFile.Status.RUNNING, queued_at=an_hour_ago, heartbeat_at=an_hour_ago, attempts=1
+    )
+
+    call_command("run_rsm_imports", "--once")
+
+    rsm_file.refresh_from_db()
+    assert rsm_file.status == RSMFile.Status.SUCCEEDED
+    assert rsm_file.attempts == 2
+    assert rsm_file.import_counts["created"] == 3
+    assert rsm_file.checkpoint_offset > 0
+
+
+@pytest.mark.django_db
+def test_run_rsm_imports_gives_up_on_exhausted_jobs(tmp_path, settings):
+    settings.MEDIA_ROOT = tmp_path
+    rsm_file = RSMFile.objects.create(csv=ContentFile(b"", name="rsm.csv"))
+
+    # its worker has died during every attempt, the last an hour ago
+    an_hour_ago = timezone.now() - datetime.timedelta(hours=1)
+    RSMFile.objects.filter(pk=rsm_file.pk).update(
+        status=RSMFile.Status.RUNNING, queued_at=an_hour_ago, heartbeat_at=an_hour_ago, attempts=MAX_ATTEMPTS
+    )
+
+    with patch.object(load_rsm_csv.Command, "process_file") as process_file:
+        call_command("run_rsm_imports", "--once")
+    process_file.assert_not_called()
+
+    rsm_file.refresh_from_db()
+    assert rsm_file.status == RSMFile.Status.FAILED
+    assert f"after {MAX_ATTEMPTS} attempts" in rsm_file.error
+    assert rsm_file.finished_at is not None
+
+
+@pytest.mark.django_db
+def test_load_rsm_csv_resumes_from_checkpoint():
+    file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rsm-data-2023-07-21.csv")
+    checkpoints = []
+
+    with patch.object(load_rsm_csv, "CHUNK_SIZE", 1), open(file_path, "rb") as f:
+        load_rsm_csv.Command().process_file(f, on_checkpoint=checkpoints.append)
+    assert [checkpoint.counts["created"] for checkpoint in checkpoints] == [1, 2, 3]
+
+    # lose everything after the first chunk, as if the import had failed there
+    Evaluation.objects.exclude(rsm_evaluation_id=11).delete()
+
+    with patch.object(load_rsm_csv, "CHUNK_SIZE", 1), open(file_path, "rb") as f:
+        counts = load_rsm_csv.Command().process_file(f, resume_from=checkpoints[0])
+
+    # the first chunk is neither read nor counted again
+    assert counts["created"] == 3
+    assert counts["unchanged"] == 0
+    assert sorted(Evaluation.objects.values_list("rsm_evaluation_id", flat=True)) == [11, 22, 33]
+
+
+@pytest.mark.django_db
+def test_load_rsm_csv_dry_run(tmp_path, django_assert_max_num_queries):
+    file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rsm-data-2023-07-21.csv")
+    call_command("load_rsm_csv", file_path)
+
+    with open(file_path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    fieldnames = list(rows[0])
+    for row in rows:
+        if row["Evaluation ID"] == "22":
+            row["Client"] = "A client that is not in DEPARTMENTS"
+        if row["Evaluation ID"] == "33":
+            row["Publication date (Year)"] = "twenty twenty"
+    rows.append({**rows[0], "Evaluation ID": "44", "Report ID": ""})
+    rows.append({**rows[0], "Evaluation ID": "40000"})
+    changed_path = tmp_path / "rsm.csv"
+    with open(changed_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    output = io.StringIO()
+    with django_assert_max_num_queries(1):
+        call_command("load_rsm_csv", str(changed_path), "--dry-run", stdout=output)
+    report = json.loads(output.getvalue())
+
+    assert report["summary"]["unchanged"] == 1
+    assert report["diff"]["update"] == ["33"]
+    assert report["diff"]["reject"] == ["22", "44", "40000"]
+    assert report["diff"]["delete"] == ["22"]
+    assert report["rejections"] == {
+        "22": ['unknown client "A client that is not in DEPARTMENTS"'],
+        "44": ['invalid report id ""'],
+        "40000": ['invalid evaluation id "40000"'],
+    }
+    assert report["warnings"] == {"33": ['Publication date has an unparseable year "twenty twenty"']}
+    assert Evaluation.objects.count() == 3
+
+    # the import itself does what the dry run said
+    with open(changed_path, "rb") as f:
+        counts = load_rsm_csv.Command().process_file(f)
+    assert (counts["updated"], counts["unchanged"], counts["deleted"]) == (1, 1, 1)
+
+
+class StubChatCompletionHandler(BaseHTTPRequestHandler):
+    """an OpenAI-compatible chat completion endpoint that upper-cases the user's message"""
+
+    received: list[str] = []
+
+    def do_POST(self):  # noqa: N802
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        txt = body["messages"][-1]["content"]
+        self.received.append(txt)
+        response = json.dumps(
+            {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": 0,
+                "model": body["model"],
+                "choices": [
+                    {"index": 0, "message": {"role": "assistant", "content": txt.upper()}, "finish_reason": "stop"}
+                ],
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_openai(settings):
+    StubChatCompletionHandler.received = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubChatCompletionHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    settings.OPENAI_BASE_URL = f"http://127.0.0.1:{server.server_port}/v1"
+    yield StubChatCompletionHandler.received
+    server.shutdown()
+
+
+@pytest.mark.django_db
+def test_reformat_description(stub_openai):
+    for rsm_evaluation_id in range(1, 6):
+        Evaluation.objects.create(
+            rsm_evaluation_id=rsm_evaluation_id,
+            title=f"evaluation {rsm_evaluation_id}",
+            brief_description="the same description",
+        )
+
+    call_command("reformat_description", "--concurrency", "4")
+
+    assert sorted(Evaluation.objects.values_list("title", flat=True)) == [f"EVALUATION {i}" for i in range(1, 6)]
+    assert set(Evaluation.objects.values_list("brief_description", flat=True)) == {"THE SAME DESCRIPTION"}
+    # identical text is only sent once
+    assert sorted(stub_openai) == [*(f"evaluation {i}" for i in range(1, 6)), "the same description"]
+
+    # results go to their own persistent cache, not the default one shared with reference data
+    assert caches["reformat"].get(reformat_cache_key("the same description")) == "THE SAME DESCRIPTION"
+    assert cache.get(reformat_cache_key("the same description")) is None
+
+    # nor is it sent again once cached
+    Evaluation.objects.update(title="evaluation 1", brief_description="the same description")
+    call_command("reformat_description")
+    assert len(stub_openai) == 6
+    assert set(Evaluation.objects.values_list("title", flat=True)) == {"EVALUATION 1"}
+
+
+@pytest.mark.django_db
+def test_reformat_many_leaves_out_empty_replies():
+    reformatter = TextReformatter(concurrency=2, requests_per_minute=6000, client=MagicMock())
+    with patch.object(reformat_description, "reformat_text", return_value=None):
+        assert reformatter.reformat_many(["some text"]) == {}
+    assert caches["reformat"].get(reformat_cache_key("some text")) is None
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=50, capacity=2)
+    start = time.monotonic()
+    for _ in range(7):
+        bucket.acquire()
+    # two from the initial burst, then five at 50 per second
+    assert time.monotonic() - start >= 0.09
+
+
+@pytest.mark.django_db
+def test_load_rsm_csv_filters_malformed_rows(tmp_path, settings):
+    settings.MEDIA_ROOT = tmp_path
+    file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rsm-data-2023-07-21.csv")
+    with open(file_path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    fieldnames = list(rows[0])
+    # in the middle of the same chunk as the good rows
+    rows.insert(1, {**rows[0], "Evaluation ID": "44", "Report ID": "not a number"})
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames)
+    writer.writeheader()
+    writer.writerows(rows)
+    rsm_file = RSMFile.objects.create(csv=ContentFile(buffer.getvalue().encode(), name="rsm.csv"))
+    RSMFile.objects.filter(pk=rsm_file.pk).queue()
+
+    call_command("run_rsm_imports", "--once")
+
+    rsm_file.refresh_from_db()
+    assert rsm_file.status == RSMFile.Status.SUCCEEDED
+    assert (rsm_file.import_counts["created"], rsm_file.import_counts["skipped"]) == (3, 1)
+    assert sorted(Evaluation.objects.values_list("rsm_evaluation_id", flat=True)) == [11, 22, 33]
+
+
+@pytest.mark.django_db
+def test_run_rsm_imports_hands_back_job_on_sigterm(tmp_path, settings):
+    settings.MEDIA_ROOT = tmp_path
+    rsm_file = RSMFile.objects.create(csv=ContentFile(b"", name="rsm.csv"))
+    RSMFile.objects.filter(pk=rsm_file.pk).queue()
+
+    def terminate(*args, **kwargs):
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    handler = signal.getsignal(signal.SIGTERM)
+    with patch.object(load_rsm_csv.Command, "process_file", terminate), pytest.raises(SystemExit):
+        call_command("run_rsm_imports", "--once")
+
+    rsm_file.refresh_from_db()
+    assert (rsm_file.status, rsm_file.attempts) == (RSMFile.Status.QUEUED, 0)
+    assert signal.getsignal(signal.SIGTERM) is handler
@@ -3,11 +3,16 @@ import pytest
 from evaluation_registry.evaluations.forms import (
     EvaluationBasicDetailsForm,
     EvaluationDesignTypeDetailForm,
+    EvaluationPoliciesForm,
     EvaluationShareForm,
     EventDateForm,
     NullableModelMultipleChoiceField,
 )
 from evaluation_registry.evaluations.models import Department, EventDate
+from evaluation_registry.evaluations.reference_data import (
+    get_departments,
+    get_design_types,
+)
 
 
 @pytest.mark.django_db
@@ -82,3 +87,44 @@ def test_evaluation_share_form(basic_evaluation, plan_link, evaluation_link, exp
     )
 
     assert len(form.errors) == expected_number_of_errors
+
+
+@pytest.mark.django_db
+def test_evaluation_policies_form(basic_evaluation, child_policy, parent_policy):
+    form = EvaluationPoliciesForm({"policies": ["child", "parent"]}, instance=basic_evaluation)
+    assert form.is_valid()
+    form.save()
+    assert set(basic_evaluation.policies.values_list("code", flat=True)) == {"child", "parent"}
+
+    form = EvaluationPoliciesForm({"policies": ["not-a-policy"]}, instance=basic_evaluation)
+    assert not form.is_valid()
+
+
+@pytest.mark.django_db
+def test_forms_validate_from_cached_reference_data(
+    basic_evaluation, cabinet_office, home_office, impact, other, django_assert_num_queries
+):
+    get_departments(), get_design_types()  # warm the cache
+
+    with django_assert_num_queries(0):
+        form = EvaluationBasicDetailsForm(
+            data={"title": "test", "lead_department": cabinet_office.code, "departments": ["", home_office.code]}
+        )
+        assert form.is_valid()
+        assert form.cleaned_data["lead_department"] == cabinet_office
+        assert form.cleaned_data["departments"] == [home_office]
+
+        form = EvaluationDesignTypeDetailForm(
+            data={"evaluation": basic_evaluation.id, "design_types": [impact.code, other.code], "text": "details"},
+            initial={"evaluation": basic_evaluation, "design_types": [other, impact]},
+            evaluation=basic_evaluation,
+        )
+        assert form.is_valid()
+        assert form.cleaned_data["evaluation"] == basic_evaluation
+        assert form.changed_data == ["text"]
+
+        form = EvaluationDesignTypeDetailForm(
+            data={"evaluation": basic_evaluation.id, "design_types": ["not-a-type"]},
+            evaluation=basic_evaluation,
+        )
+        assert form.errors["design_types"] == ["Select a valid choice. not-a-type is not one of the available choices."]
@@ -1,9 +1,12 @@
 import pytest
-from django.db import IntegrityError
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
 
 from evaluation_registry.evaluations.models import (
     Evaluation,
     EvaluationDepartmentAssociation,
+    EvaluationDesignType,
+    Taxonomy,
 )
 
 
@@ -18,6 +21,28 @@ def test_evaluation(cabinet_office_led_evaluation, cabinet_office, home_office):
     assert cabinet_office_led_evaluation.visibility == Evaluation.Visibility.PUBLIC.value
 
 
+@pytest.mark.django_db
+def test_evaluation_with_detail(
+    cabinet_office_led_evaluation, home_office, evaluation_impact_type_link, evaluation_other_type_link, child_policy
+):
+    EvaluationDepartmentAssociation.objects.create(
+        evaluation=cabinet_office_led_evaluation, department=home_office, is_lead=False
+    )
+    cabinet_office_led_evaluation.policies.add(child_policy)
+
+    evaluation = Evaluation.objects.get(pk=cabinet_office_led_evaluation.pk)
+    detailed_evaluation = Evaluation.objects.with_detail().get(pk=cabinet_office_led_evaluation.pk)
+
+    with CaptureQueriesContext(connection) as queries:
+        assert detailed_evaluation.lead_department == evaluation.lead_department
+        assert detailed_evaluation.other_departments == list(evaluation.other_departments)
+        assert detailed_evaluation.types_text_list == evaluation.types_text_list
+        assert detailed_evaluation.other_design_types == list(evaluation.other_design_types)
+        assert detailed_evaluation.get_policies_text_list() == evaluation.get_policies_text_list()
+    # only the un-prefetched evaluation went to the database
+    assert len(queries) == 5
+
+
 @pytest.mark.django_db
 def test_evaluation_lead_constraint(cabinet_office_led_evaluation, home_office):
     with pytest.raises(IntegrityError) as error:
@@ -52,3 +77,87 @@ def test_evaluation_duplicate_constraint(cabinet_office_led_evaluation, cabinet_
 def test_taxonomy(parent_policy, child_policy):
     assert parent_policy.__str__() == parent_policy.display
     assert child_policy.__str__() == f"{parent_policy.display} > {child_policy.display}"
+
+
+@pytest.mark.django_db
+def test_abstract_choice_path(parent_policy, child_policy):
+    assert parent_policy.path == "parent/"
+    assert child_policy.path == "parent/child/"
+
+    new_root = Taxonomy.objects.create(code="new-root", display="New root")
+    parent_policy.parent = new_root
+    parent_policy.save()
+
+    child_policy.refresh_from_db()
+    assert child_policy.path == "new-root/parent/child/"
+    assert EvaluationDesignType.objects.get(code="cluster").path == "impact/rct/cluster/"
+
+
+@pytest.mark.django_db
+def test_abstract_choice_failed_save_leaves_subtree(parent_policy, child_policy):
+    Taxonomy.objects.create(code="taken", display="Taken")
+    parent_policy.code = "taken"
+
+    with pytest.raises(IntegrityError):
+        parent_policy.save()
+
+    child_policy.refresh_from_db()
+    assert child_policy.path == "parent/child/"
+
+
+@pytest.mark.django_db
+def test_evaluation_lead_department_follows_associations(basic_evaluation, cabinet_office, home_office):
+    assert basic_evaluation.lead_department is None
+
+    lead = EvaluationDepartmentAssociation.objects.create(
+        evaluation=basic_evaluation, department=cabinet_office, is_lead=True
+    )
+    assert basic_evaluation.lead_department == cabinet_office
+    assert Evaluation.objects.get(pk=basic_evaluation.pk).lead_department == cabinet_office
+
+    lead.department = home_office
+    lead.save()
+    assert Evaluation.objects.get(pk=basic_evaluation.pk).lead_department == home_office
+
+    lead.is_lead = False
+    lead.save()
+    assert Evaluation.objects.get(pk=basic_evaluation.pk).lead_department is None
+
+    lead.is_lead = True
+    lead.save()
+    EvaluationDepartmentAssociation.objects.filter(pk=lead.pk).delete()
+    assert Evaluation.objects.get(pk=basic_evaluation.pk).lead_department is None
+
+
+@pytest.mark.django_db
+def test_evaluation_lead_department_is_not_overwritten_by_save(basic_evaluation, cabinet_office):
+    stale_evaluation = Evaluation.objects.get(pk=basic_evaluation.pk)
+    EvaluationDepartmentAssociation.objects.create(evaluation=basic_evaluation, department=cabinet_office, is_lead=True)
+
+    stale_evaluation.title = "a new title"
+    stale_evaluation.save()
+    assert Evaluation.objects.get(pk=basic_evaluation.pk).lead_department == cabinet_office
+
+
+@pytest.mark.django_db
+def test_evaluation_save_writes_the_row_once(alice, django_assert_num_queries):
+    # the evaluation row, and its history row
+    with django_assert_num_queries(2):
+        evaluation = Evaluation.objects.create(created_by=alice, title="Rail passenger survey")
+    with django_assert_num_queries(2):
+        evaluation.brief_description = "commuter satisfaction"
+        evaluation.save()
+
+    assert Evaluation.objects.filter(search_vector="commuter").get() == evaluation
+    assert Evaluation.objects.filter(search_vector="rail").get() == evaluation
+
+
+@pytest.mark.django_db
+def test_evaluation_update_lead_department(basic_evaluation, cabinet_office):
+    EvaluationDepartmentAssociation.objects.bulk_create(
+        [EvaluationDepartmentAssociation(evaluation=basic_evaluation, department=cabinet_office, is_lead=True)]
+    )
+    assert Evaluation.objects.get(pk=basic_evaluation.pk).lead_department is None
+
+    assert Evaluation.objects.all().update_lead_department() == 1
+    assert Evaluation.objects.get(pk=basic_evaluation.pk).lead_department == cabinet_office
@@ -0,0 +1,82 @@
+import pytest
+
+from evaluation_registry.evaluations.models import (
+    Department,
+    EvaluationDesignType,
+    Taxonomy,
+)
+from evaluation_registry.evaluations.reference_data import (
+    get_departments,
+    get_root_design_types,
+    get_taxonomies,
+)
+
+
+@pytest.mark.django_db
+def test_reference_data_is_cached(django_assert_num_queries):
+    departments = get_departments()
+    root_design_types = get_root_design_types()
+
+    with django_assert_num_queries(0):
+        assert get_departments() == departments
+        assert get_root_design_types() == root_design_types
+
+    assert all(design_type.parent_id is None for design_type in root_design_types)
+
+
+@pytest.mark.django_db
+def test_reference_data_invalidated_on_save_and_delete(parent_policy, child_policy):
+    assert child_policy in get_taxonomies()
+
+    child_policy.delete()
+    assert child_policy not in get_taxonomies()
+
+    department = Department.objects.create(code="new-department", display="New Department")
+    assert department in get_departments()
+
+    department.display = "Renamed Department"
+    department.save()
+    assert next(d for d in get_departments() if d.code == "new-department").display == "Renamed Department"
+
+
+@pytest.mark.django_db
+def test_cached_taxonomies_do_not_lazy_load_parents(child_policy, django_assert_num_queries):
+    taxonomies = get_taxonomies()
+
+    with django_assert_num_queries(0):
+        assert f"{child_policy.parent.display} > {child_policy.display}" in [str(t) for t in taxonomies]
+
+
+@pytest.mark.django_db
+def test_design_type_tree(django_assert_num_queries):
+    tree = EvaluationDesignType.objects.tree()
+
+    with django_assert_num_queries(0):
+        assert EvaluationDesignType.objects.tree() is tree
+        assert "cluster" in tree
+        assert tree.get("cluster").display == "Cluster RCT"
+        assert tree.parent("cluster").code == "rct"
+        assert [t.code for t in tree.ancestors("cluster")] == ["rct", "impact"]
+        assert {t.code for t in tree.children("impact")} >= {"rct", "quasi_experimental", "theory", "generic"}
+        assert {"rct", "cluster", "propensity"} <= {t.code for t in tree.descendants("impact")}
+        assert "individual_process" not in {t.code for t in tree.descendants("impact")}
+        assert {t.code for t in tree.roots} == {"impact", "process", "economic", "other"}
+        assert tree.get("not-a-code") is None
+        assert tree.children("not-a-code") == ()
+
+
+@pytest.mark.django_db
+def test_taxonomy_tree_rebuilt_on_change(parent_policy, child_policy):
+    assert [t.code for t in Taxonomy.objects.tree().children("parent")] == ["child"]
+
+    Taxonomy.objects.create(code="grandchild", display="Grandchild", parent=child_policy)
+    assert [t.code for t in Taxonomy.objects.tree().ancestors("grandchild")] == ["child", "parent"]
+
+
+@pytest.mark.django_db
+def test_taxonomy_str_uses_tree(child_policy, django_assert_num_queries):
+    child = Taxonomy.objects.select_related(None).get(code="child")
+    Taxonomy.objects.tree()
+
+    with django_assert_num_queries(0):
+        assert str(child) == "Parent > Child"
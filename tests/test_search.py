@@ -3,9 +3,13 @@ import pytest
 from evaluation_registry.evaluations.models import (
     Evaluation,
     EvaluationDepartmentAssociation,
+    EvaluationDesignType,
+    Taxonomy,
 )
+from evaluation_registry.evaluations.pagination import keyset_paginate
 from evaluation_registry.evaluations.views import (
     authorised_base_evaluation_queryset,
+    count_facets,
     filter_by_department_and_types,
     full_text_search,
 )
@@ -87,3 +91,188 @@ def test_full_text_search(evaluations, search_term, expected_number_of_results,
 def test_filter_evaluations(evaluations, departments, types, expected_number_of_results):
     results = filter_by_department_and_types(evaluations, departments, types)
     assert len(results) == expected_number_of_results
+
+
+@pytest.mark.django_db
+def test_search_vector_kept_current_on_save(basic_evaluation):
+    assert not full_text_search(Evaluation.objects.all(), "transport").exists()
+
+    basic_evaluation.title = "public transport"
+    basic_evaluation.save()
+    assert full_text_search(Evaluation.objects.all(), "transport").get() == basic_evaluation
+
+    basic_evaluation.brief_description = "a study of rail fares"
+    basic_evaluation.save(update_fields=["brief_description"])
+    assert full_text_search(Evaluation.objects.all(), "fares").get() == basic_evaluation
+
+
+@pytest.mark.django_db
+def test_update_search_vector_after_bulk_create():
+    Evaluation.objects.bulk_create([Evaluation(title="bulk loaded evaluation")])
+    assert not full_text_search(Evaluation.objects.all(), "bulk").exists()
+
+    Evaluation.objects.filter(search_vector__isnull=True).update_search_vector()
+    assert full_text_search(Evaluation.objects.all(), "bulk").count() == 1
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("number_of_evaluations", [1, 30])
+def test_evaluation_list_view_performance(
+    client, alice, cabinet_office, home_office, impact, other, number_of_evaluations, django_assert_max_num_queries
+):
+    client.force_login(user=alice)
+    for i in range(number_of_evaluations):
+        evaluation = Evaluation.objects.create(title=f"evaluation {i}", visibility=Evaluation.Visibility.PUBLIC)
+        evaluation.evaluation_design_types.add(impact, other)
+        EvaluationDepartmentAssociation.objects.create(evaluation=evaluation, department=cabinet_office, is_lead=True)
+        EvaluationDepartmentAssociation.objects.create(evaluation=evaluation, department=home_office)
+
+    with django_assert_max_num_queries(10):
+        response = client.get("/search/", {"evaluations_to_show": "public"})
+    assert response.status_code == 200
+    assert f"of <b>{number_of_evaluations}</b> result".encode() in response.content
+    assert f"Cabinet Office ({number_of_evaluations})".encode() in response.content
+
+    with django_assert_max_num_queries(8):  # facet counts and reference data are now cached
+        client.get("/search/", {"evaluations_to_show": "public"})
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("page", ["999", "-1", "not-a-page"])
+def test_evaluation_list_view_out_of_range_page(client, alice, page):
+    client.force_login(user=alice)
+    for i in range(30):
+        Evaluation.objects.create(title=f"evaluation {i}", visibility=Evaluation.Visibility.PUBLIC)
+
+    response = client.get("/search/", {"evaluations_to_show": "public", "page": page})
+    assert response.status_code == 200
+    assert b'aria-label="Page 2"' in response.content
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("search_term", ["", "transport"])
+def test_keyset_paginate(search_term):
+    for i in range(7):
+        Evaluation.objects.create(title=f"transport {'transport ' * i}evaluation {i}")
+
+    evaluations = full_text_search(Evaluation.objects.all(), search_term)
+    seen, cursor = [], None
+    for _ in range(3):
+        page, cursor = keyset_paginate(evaluations, cursor, rank_ordered=bool(search_term), page_size=3)
+        seen.extend(page)
+
+    assert cursor is None
+    assert len(seen) == len({e.id for e in seen}) == 7
+    assert [e.keyset_key for e in seen] == sorted((e.keyset_key for e in seen), reverse=True)
+
+
+@pytest.mark.django_db
+def test_evaluation_list_view_cursor_mode(client, alice):
+    client.force_login(user=alice)
+    for i in range(30):
+        Evaluation.objects.create(title=f"evaluation {i}", visibility=Evaluation.Visibility.PUBLIC)
+
+    response = client.get("/search/", {"evaluations_to_show": "public", "cursor": ""})
+    assert response.status_code == 200
+    assert b"cursor=" in response.content
+
+    response = client.get("/search/", {"evaluations_to_show": "public", "cursor": "not-a-cursor"})
+    assert response.status_code == 404
+
+
+@pytest.mark.django_db
+def test_filter_evaluations_uses_semi_joins(evaluations):
+    results = filter_by_department_and_types(evaluations, ["cabinet-office", "home-office"], ["impact", "other"])
+    sql = str(results.query)
+    assert "EXISTS" in sql
+    assert "DISTINCT" not in sql
+    assert len(results) == 1
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "departments, types, expected_department_counts, expected_type_counts",
+    [
+        ([], [], {"cabinet-office": 2, "home-office": 1}, {"impact": 2, "other": 1}),
+        (["home-office"], [], {"cabinet-office": 2, "home-office": 1}, {}),
+        ([], ["other"], {}, {"impact": 2, "other": 1}),
+        (["cabinet-office"], ["impact"], {"cabinet-office": 1}, {"impact": 1}),
+    ],
+)
+def test_count_facets(
+    evaluations, departments, types, expected_department_counts, expected_type_counts, django_assert_num_queries
+):
+    EvaluationDesignType.objects.tree()  # reference data is cached across requests
+
+    with django_assert_num_queries(1):
+        counts = count_facets(evaluations, departments, types)
+    assert counts == {
+        "departments": expected_department_counts,
+        "evaluation_types": expected_type_counts,
+        "policies": {},
+    }
+
+
+@pytest.mark.django_db
+def test_filter_evaluations_matches_child_types(alice):
+    rct = EvaluationDesignType.objects.get(code="rct")
+    cluster = EvaluationDesignType.objects.get(code="cluster")
+    rct_evaluation = Evaluation.objects.create(title="rct")
+    rct_evaluation.evaluation_design_types.add(rct)
+    cluster_evaluation = Evaluation.objects.create(title="cluster")
+    cluster_evaluation.evaluation_design_types.add(cluster)
+
+    assert set(filter_by_department_and_types(Evaluation.objects.all(), [], ["impact"])) == {
+        rct_evaluation,
+        cluster_evaluation,
+    }
+    assert set(filter_by_department_and_types(Evaluation.objects.all(), [], ["rct"])) == {
+        rct_evaluation,
+        cluster_evaluation,
+    }
+    assert set(filter_by_department_and_types(Evaluation.objects.all(), [], ["cluster"])) == {cluster_evaluation}
+    assert not filter_by_department_and_types(Evaluation.objects.all(), [], ["process"]).exists()
+    assert count_facets(Evaluation.objects.all(), [], [])["evaluation_types"] == {"impact": 2}
+
+
+@pytest.mark.django_db
+def test_filter_evaluations_by_policy_area(evaluations, parent_policy, child_policy):
+    other_policy = Taxonomy.objects.create(code="other-policy", display="Other policy")
+    e1 = evaluations.get(title="summaries of policies")
+    e2 = evaluations.get(title="public transport")
+    e3 = evaluations.get(title="details of something or other")
+    e1.policies.add(child_policy)
+    e2.policies.add(parent_policy)
+    e3.policies.add(other_policy)
+
+    assert set(filter_by_department_and_types(evaluations, [], [], ["parent"])) == {e1, e2}
+    assert set(filter_by_department_and_types(evaluations, [], [], ["child"])) == {e1}
+    assert set(filter_by_department_and_types(evaluations, [], [], ["child", "other-policy"])) == {e1, e3}
+    assert not filter_by_department_and_types(evaluations, [], [], ["not-a-policy"]).exists()
+
+    counts = count_facets(evaluations, [], [], [])
+    assert counts["policies"] == {"parent": 2, "other-policy": 1}
+    assert count_facets(evaluations, ["home-office"], [], ["other-policy"])["policies"] == {"parent": 1}
+    assert count_facets(evaluations, [], ["other"], [])["policies"] == {"other-policy": 1}
+
+
+@pytest.mark.django_db
+def test_evaluation_list_view_policies(client, alice, parent_policy, child_policy):
+    client.force_login(user=alice)
+    evaluation = Evaluation.objects.create(title="child policy evaluation", visibility=Evaluation.Visibility.PUBLIC)
+    evaluation.policies.add(child_policy)
+
+    response = client.get("/search/", {"evaluations_to_show": "public", "policies": "parent"})
+    assert response.status_code == 200
+    assert b"child policy evaluation" in response.content
+    assert b"Parent (1)" in response.content
+
+
+@pytest.mark.django_db
+def test_filter_evaluations_by_policy_with_empty_path(evaluations, parent_policy):
+    # a path left empty by a write that bypassed save must not match every evaluation
+    Taxonomy.objects.filter(pk=parent_policy.pk).update(path="")
+    e1 = evaluations.get(title="summaries of policies")
+    e1.policies.add(parent_policy)
+
+    assert set(filter_by_department_and_types(evaluations, [], [], ["parent"])) == {e1}
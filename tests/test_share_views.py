@@ -1,9 +1,21 @@
-from unittest.mock import patch
+from contextlib import contextmanager
+from unittest.mock import MagicMock, patch
 
 import pytest
 from django.http import HttpResponse, HttpResponseForbidden
 
 from evaluation_registry.evaluations import share_views
+from evaluation_registry.evaluations.models import Evaluation
+from evaluation_registry.evaluations.views import evaluation_type_view
+
+
+@contextmanager
+def patch_step_view(view):
+    """replace view, in every share step that shows it, with a mock"""
+    mock_view = MagicMock(return_value=HttpResponse())
+    steps = tuple(step._replace(view=mock_view) if step.view is view else step for step in share_views.SHARE_STEPS)
+    with patch.object(share_views, "SHARE_STEPS", steps):
+        yield mock_view
 
 
 @pytest.mark.django_db
@@ -30,12 +42,12 @@ def test_create_view(alice, client):
 @pytest.mark.django_db
 def test_share_view_no_design_types(alice, client, basic_evaluation):
     client.force_login(user=alice)
-    with patch.object(share_views, "evaluation_type_view", return_value=HttpResponse()) as mock_type_view:
+    with patch_step_view(evaluation_type_view) as mock_type_view:
         client.get(f"/evaluation/{basic_evaluation.id}/share/1/")
     mock_type_view.assert_called_once()
     assert len(mock_type_view.call_args) == 2
 
-    with patch.object(share_views, "evaluation_type_view", return_value=HttpResponse()) as mock_type_view:
+    with patch_step_view(evaluation_type_view) as mock_type_view:
         client.get(f"/evaluation/{basic_evaluation.id}/share/2/")
     mock_type_view.assert_not_called()
 
@@ -43,7 +55,7 @@ def test_share_view_no_design_types(alice, client, basic_evaluation):
 @pytest.mark.django_db
 def test_share_view_with_impact_type(alice, client, impact_evaluation):
     client.force_login(user=alice)
-    with patch.object(share_views, "evaluation_type_view", return_value=HttpResponse()) as mock_type_view:
+    with patch_step_view(evaluation_type_view) as mock_type_view:
         client.get(f"/evaluation/{impact_evaluation.id}/share/2/")
     mock_type_view.assert_called_once()
 
@@ -55,3 +67,48 @@ def test_share_view_different_user(client, basic_evaluation, create_user):
 
     response = client.get(f"/evaluation/{basic_evaluation.id}/share/1/")
     assert isinstance(response, HttpResponseForbidden)
+
+
+@pytest.mark.django_db
+def test_share_view_routing_performance(alice, client, impact_evaluation, django_assert_num_queries):
+    client.force_login(user=alice)
+
+    # session, user, evaluation and one fetch of its design-type codes
+    with (
+        patch_step_view(evaluation_type_view) as mock_type_view,
+        django_assert_num_queries(4),
+    ):
+        client.get(f"/evaluation/{impact_evaluation.id}/share/2/")
+    assert mock_type_view.call_args[1] == {"next_page": 3, "parent": "impact"}
+
+    # steps after the design types never fetch them
+    with (
+        patch_step_view(share_views.share_confirmation_view) as mock_confirmation_view,
+        django_assert_num_queries(3),
+    ):
+        client.get(f"/evaluation/{impact_evaluation.id}/share/{len(share_views.SHARE_STEPS)}/")
+    mock_confirmation_view.assert_called_once()
+
+
+@pytest.mark.django_db
+def test_evaluation_create_view_post(alice, client, cabinet_office, home_office):
+    client.force_login(user=alice)
+
+    response = client.post(
+        "/evaluation/create/3/ongoing",
+        {
+            "title": "a new evaluation",
+            "status": "ongoing",
+            "lead_department": "cabinet-office",
+            "departments": ["home-office"],
+            "form_complete": "true",
+        },
+    )
+    assert response.status_code == 302
+
+    evaluation = Evaluation.objects.get(title="a new evaluation")
+    assert evaluation.created_by == alice
+    assert evaluation.lead_department == cabinet_office
+    assert list(evaluation.other_departments) == [home_office]
+    assert evaluation.history.count() == 1
+    assert not hasattr(evaluation.history.get(), "lead_department")
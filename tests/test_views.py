@@ -1,17 +1,23 @@
 from unittest.mock import patch
 
 import pytest
+from django.db import connection
 from django.forms import Form
 from django.http import HttpResponseForbidden
+from django.test.utils import CaptureQueriesContext
 
 from evaluation_registry.evaluations.models import (
+    Department,
+    Evaluation,
     EvaluationDepartmentAssociation,
+    EvaluationDesignType,
     EvaluationDesignTypeDetail,
     EventDate,
     Report,
 )
 from evaluation_registry.evaluations.views import (
     render,
+    update_evaluation_departments,
     update_evaluation_design_objects,
 )
 
@@ -124,8 +130,14 @@ def test_evaluation_detail_view_performance(
 
     basic_evaluation.save()
 
-    with django_assert_max_num_queries(9):
-        client.get(f"/evaluation/{basic_evaluation.id}/")
+    # session, user, evaluation and one query for each of its four prefetched relations
+    with django_assert_max_num_queries(7):
+        response = client.get(f"/evaluation/{basic_evaluation.id}/")
+    content = response.content.decode()
+    assert str(cabinet_office) in content
+    assert str(home_office) in content
+    assert "Child, Parent" in content
+    assert "January 2000" in content
 
 
 @pytest.mark.django_db
@@ -139,3 +151,107 @@ def test_update_title_department_different_user(alice, client, cabinet_office_le
     client.force_login(user=alice)
     response = client.get(f"/evaluation/{cabinet_office_led_evaluation.id}/update-title-departments/")
     assert response.status_code == 200
+
+
+@pytest.mark.django_db
+def test_update_title_department_view_post(
+    alice, client, cabinet_office_led_evaluation, cabinet_office, home_office, django_assert_max_num_queries
+):
+    hm_treasury = Department.objects.get(code="hm-treasury")
+    EvaluationDepartmentAssociation.objects.create(
+        evaluation=cabinet_office_led_evaluation, department=hm_treasury, is_lead=False
+    )
+    client.force_login(user=alice)
+
+    # swap the lead for an existing department, keep another and add a new one
+    with django_assert_max_num_queries(20):
+        response = client.post(
+            f"/evaluation/{cabinet_office_led_evaluation.id}/update-title-departments/",
+            {
+                "title": "new title",
+                "lead_department": "hm-treasury",
+                "departments": ["cabinet-office", "home-office"],
+                "form_complete": "true",
+            },
+        )
+    assert response.status_code == 302
+
+    evaluation = Evaluation.objects.get(pk=cabinet_office_led_evaluation.pk)
+    assert evaluation.title == "new title"
+    assert evaluation.lead_department == hm_treasury
+    assert set(evaluation.other_departments) == {cabinet_office, home_office}
+
+
+@pytest.mark.django_db
+def test_update_evaluation_departments(basic_evaluation, cabinet_office, home_office, django_assert_max_num_queries):
+    hm_treasury = Department.objects.get(code="hm-treasury")
+
+    update_evaluation_departments(basic_evaluation, cabinet_office, [home_office, hm_treasury])
+    assert basic_evaluation.lead_department == cabinet_office
+    assert set(basic_evaluation.other_departments) == {home_office, hm_treasury}
+
+    # the cost does not depend on how many departments are added or removed
+    with django_assert_max_num_queries(8):
+        update_evaluation_departments(basic_evaluation, home_office, [])
+    assert Evaluation.objects.get(pk=basic_evaluation.pk).lead_department == home_office
+    assert list(basic_evaluation.departments.all()) == [home_office]
+
+
+@pytest.mark.django_db
+def test_evaluation_update_type_view_post_is_constant_cost(client, basic_evaluation, impact, alice):
+    client.force_login(user=alice)
+    children = [
+        design_type.code
+        for design_type in EvaluationDesignType.objects.filter(parent=impact, collect_description=False)
+    ]
+    assert len(children) > 1
+
+    def post(selected):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post(
+                f"/evaluation/{basic_evaluation.id}/update-type/impact",
+                {"evaluation": basic_evaluation.id, "design_types": selected},
+            )
+        assert response.status_code == 302
+        assert set(
+            EvaluationDesignTypeDetail.objects.filter(evaluation=basic_evaluation).values_list(
+                "design_type__code", flat=True
+            )
+        ) == set(selected)
+        return len(queries)
+
+    # adding or removing one type costs the same as adding or removing all of them
+    EvaluationDesignType.objects.tree()  # warm the reference data
+    one_added, one_removed = post(children[:1]), post([])
+    all_added, all_removed = post(children), post([])
+    assert one_added == all_added
+    assert one_removed == all_removed
+
+
+@pytest.mark.django_db
+def test_evaluation_update_dates_view_post_is_constant_cost(client, alice, create_user):
+    client.force_login(user=alice)
+
+    def post(number_of_dates):
+        evaluation = Evaluation.objects.create(created_by=alice)
+        dates = [EventDate.objects.create(evaluation=evaluation, year=2000 + i) for i in range(number_of_dates)]
+        data = {"form-TOTAL_FORMS": number_of_dates + 1, "form-INITIAL_FORMS": number_of_dates}
+        for i, event_date in enumerate([*dates, None]):
+            data |= {
+                f"form-{i}-id": event_date.id if event_date else "",
+                f"form-{i}-evaluation": evaluation.id,
+                f"form-{i}-category": EventDate.Category.OTHER,
+                f"form-{i}-other_description": "milestone",
+                f"form-{i}-month": 6,
+                f"form-{i}-year": 2020 + i,
+            }
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post(f"/evaluation/{evaluation.id}/update-dates/", data)
+        assert response.status_code == 302
+        assert sorted(evaluation.event_dates.values_list("year", "month")) == [
+            (2020 + i, 6) for i in range(number_of_dates + 1)
+        ]
+        return len(queries)
+
+    assert post(1) == post(10)